@@ -0,0 +1,194 @@
+"""
+Binary cache for the compendium
+
+`demons.json` gets compiled into a file next to it so the cog doesn't have to parse the whole
+thing every time it loads. The layout is (all little endian):
+
+    header: magic, version, sha256 of the json it was built from, demon count
+    index:  one fixed size entry per demon with what the compendium's indexes need
+    blobs:  names and the compact json of each demon, only decoded when a demon is looked up
+
+If the hash doesn't match the json anymore the cache is stale and the json gets used instead.
+
+To build it ahead of time run `python -m smtred.cache path/to/demons.json`
+"""
+
+# Copyright (c) 2025 - Amy (jojo7791)
+# Licensed under MIT
+
+from __future__ import annotations
+
+import hashlib
+import logging
+import mmap
+import os
+import struct
+import sys
+import time
+from pathlib import Path
+from typing import Dict, Final, List, Optional, Tuple, Union
+
+from .compendium import Compendium, DemonTemplate, _Entry
+from .demons import ELEMENTS, Arcana, ResistEnum, _pack_resistances
+from .utils import dumps_json, loads_json
+
+__all__: Final[Tuple[str, ...]] = ("compile_cache", "load_compendium")
+
+log = logging.getLogger("red.jojocogs.smtred.cache")
+
+MAGIC: Final[bytes] = b"SMTC"
+# Bump this whenever the layout, `Arcana`, `ResistEnum`, or `ELEMENTS` change
+VERSION: Final[int] = 1
+CACHE_SUFFIX: Final[str] = ".smtc"
+
+# magic, version, sha256, count
+_HEADER: Final[struct.Struct] = struct.Struct("<4sH32sI")
+# name offset, name length, level, arcana, resistances, record offset, record length
+_ENTRY: Final[struct.Struct] = struct.Struct(f"<IHHB{len(ELEMENTS)}sII")
+
+_ARCANA: Final[Tuple[Arcana, ...]] = tuple(Arcana)
+_ARCANA_INDEX: Final[Dict[Arcana, int]] = {arcana: i for i, arcana in enumerate(_ARCANA)}
+_RESISTS: Final[Tuple[ResistEnum, ...]] = tuple(ResistEnum)
+_RESIST_INDEX: Final[Dict[ResistEnum, int]] = {resist: i for i, resist in enumerate(_RESISTS)}
+
+
+def content_hash(raw: bytes) -> bytes:
+    return hashlib.sha256(raw).digest()
+
+
+def _cache_path_for(json_path: Path) -> Path:
+    return json_path.with_suffix(CACHE_SUFFIX)
+
+
+def build_cache(data: Dict[str, dict], digest: bytes) -> bytes:
+    """Compile the demon data into the cache layout"""
+    entries: List[bytes] = []
+    blobs = bytearray()
+    for name, demon in data.items():
+        template = DemonTemplate.from_json(name, demon)
+        encoded_name = name.encode()
+        name_offset = len(blobs)
+        blobs += encoded_name
+        record_offset = len(blobs)
+        record = dumps_json(demon)
+        blobs += record
+        resistances = bytes(
+            _RESIST_INDEX[r] for r in _pack_resistances(template.resistances)  # type:ignore
+        )
+        entries.append(
+            _ENTRY.pack(
+                name_offset,
+                len(encoded_name),
+                template.level,
+                _ARCANA_INDEX[template.arcana],
+                resistances,
+                record_offset,
+                len(record),
+            )
+        )
+    header = _HEADER.pack(MAGIC, VERSION, digest, len(entries))
+    return header + b"".join(entries) + bytes(blobs)
+
+
+def _write_cache(path: Path, payload: bytes) -> None:
+    # Write to a temp file first so a half written cache is never picked up
+    tmp = path.with_suffix(f"{CACHE_SUFFIX}.tmp")
+    with open(tmp, "wb") as fp:
+        fp.write(payload)
+    os.replace(tmp, path)
+
+
+def compile_cache(json_path: Union[str, Path], cache_path: Optional[Path] = None) -> Path:
+    """Build the cache for a json file, returning where it was written"""
+    json_path = Path(json_path)
+    cache_path = cache_path or _cache_path_for(json_path)
+    raw = json_path.read_bytes()
+    _write_cache(cache_path, build_cache(loads_json(raw), content_hash(raw)))
+    return cache_path
+
+
+def load_cache(cache_path: Path, digest: bytes) -> Optional[Compendium]:
+    """Map the cache into a `Compendium`, or None if it's missing, stale, or broken"""
+    try:
+        with open(cache_path, "rb") as fp:
+            mapped = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+
+    try:
+        magic, version, cached_digest, count = _HEADER.unpack_from(mapped, 0)
+    except struct.error:
+        mapped.close()
+        return None
+    if magic != MAGIC or version != VERSION or cached_digest != digest:
+        mapped.close()
+        return None
+
+    blob_start = _HEADER.size + _ENTRY.size * count
+    entries: List[_Entry] = []
+    # {KEY: (NAME, RECORD_START, RECORD_END)}
+    records: Dict[str, Tuple[str, int, int]] = {}
+    try:
+        for name_offset, name_len, level, arcana, resists, offset, length in _ENTRY.iter_unpack(
+            mapped[_HEADER.size : blob_start]
+        ):
+            start = blob_start + name_offset
+            name = mapped[start : start + name_len].decode()
+            key = name.lower()
+            entries.append(
+                _Entry(key, name, level, _ARCANA[arcana], tuple(_RESISTS[r] for r in resists))
+            )
+            records[key] = (name, blob_start + offset, blob_start + offset + length)
+    except (struct.error, IndexError, UnicodeDecodeError):
+        mapped.close()
+        return None
+
+    def loader(key: str) -> DemonTemplate:
+        name, start, end = records[key]
+        return DemonTemplate.from_json(name, loads_json(mapped[start:end]))
+
+    return Compendium(entries, loader)
+
+
+def load_compendium(
+    json_path: Union[str, Path], cache_path: Optional[Path] = None, *, write_cache: bool = True
+) -> Compendium:
+    """Load the compendium from the cache if it's fresh, otherwise from the json
+
+    When the json has to be used the cache gets rebuilt for next time, unless `write_cache`
+    is False (for when a bunch of processes load it at once and would fight over the file)
+    """
+    json_path = Path(json_path)
+    cache_path = cache_path or _cache_path_for(json_path)
+    start = time.perf_counter()
+    raw = json_path.read_bytes()
+    digest = content_hash(raw)
+
+    compendium = load_cache(cache_path, digest)
+    if compendium is not None:
+        log.info(
+            "Loaded %d demons from the cache in %.2fms",
+            len(compendium),
+            (time.perf_counter() - start) * 1000,
+        )
+        return compendium
+
+    data = loads_json(raw)
+    compendium = Compendium.from_json(data)
+    log.info(
+        "Loaded %d demons from json in %.2fms (cache was missing or stale)",
+        len(compendium),
+        (time.perf_counter() - start) * 1000,
+    )
+    if not write_cache:
+        return compendium
+    try:
+        _write_cache(cache_path, build_cache(data, digest))
+    except OSError as e:
+        log.warning("Couldn't write the compendium cache to %s", cache_path, exc_info=e)
+    return compendium
+
+
+if __name__ == "__main__":
+    for path in sys.argv[1:]:
+        print(f"Wrote {compile_cache(path)}")
@@ -0,0 +1,150 @@
+# Copyright (c) 2025 - Amy (jojo7791)
+# Licensed under MIT
+
+from __future__ import annotations
+
+from typing import Dict, Final, List, Mapping, NamedTuple, Optional, Tuple, Union
+
+import discord
+
+from .compendium import DemonTemplate
+from .demons import ELEMENTS, Demon, ResistEnum
+from .utils import CacheStats, LRUCache
+
+__all__: Final[Tuple[str, ...]] = ("CardCache", "DemonCard")
+
+# How many demon cards to keep around
+CARD_CACHE_SIZE: Final[int] = 512
+
+# The order resistances are listed in, NONE isn't worth showing
+_RESIST_ORDER: Final[Tuple[ResistEnum, ...]] = (
+    ResistEnum.WEAK,
+    ResistEnum.STRONG,
+    ResistEnum.NULL,
+    ResistEnum.ABSORB,
+)
+
+
+def _format_stats(stats: Mapping[str, Union[str, int]]) -> str:
+    # hp and sp read better as HP and SP
+    return (
+        "\n".join(
+            f"**{name.upper() if len(name) == 2 else name.capitalize()}** {value}"
+            for name, value in stats.items()
+        )
+        or "None..."
+    )
+
+
+def _format_abilities(abilities: Mapping[str, int]) -> str:
+    return (
+        "\n".join(f"**{name.capitalize()}** {value}" for name, value in abilities.items())
+        or "None..."
+    )
+
+
+def _format_resistances(resistances: Mapping[str, str]) -> str:
+    grouped: Dict[ResistEnum, List[str]] = {}
+    for element in ELEMENTS:
+        resist = ResistEnum(resistances.get(element, "NONE"))
+        grouped.setdefault(resist, []).append(element.capitalize())
+    lines = [
+        f"**{resist.value.capitalize()}** {', '.join(grouped[resist])}"
+        for resist in _RESIST_ORDER
+        if resist in grouped
+    ]
+    return "\n".join(lines) or "None..."
+
+
+class DemonCard(NamedTuple):
+    """Everything `send_demon` needs, worked out once
+
+    The embed is never sent as is, `to_embed` gives a copy with the colour on it
+    """
+
+    text: str
+    embed: discord.Embed
+
+    @classmethod
+    def build(
+        cls,
+        name: str,
+        description: str,
+        url: str,
+        arcana: str,
+        stats: Mapping[str, Union[str, int]],
+        abilities: Mapping[str, int],
+        resistances: Mapping[str, str],
+    ) -> DemonCard:
+        fields = (
+            ("Stats", _format_stats(stats)),
+            ("Abilities", _format_abilities(abilities)),
+            ("Arcana", arcana),
+            ("Resistances", _format_resistances(resistances)),
+        )
+        text = f"# Demon {name}\n\n" + "\n\n".join(
+            f"## {title}\n{value}" for title, value in fields
+        )
+        embed = discord.Embed(title=f"Demon {name}", description=description or None)
+        if url:
+            embed.set_image(url=url)
+        for title, value in fields:
+            embed.add_field(name=title, value=value)
+        return cls(text, embed)
+
+    @classmethod
+    def from_template(cls, template: DemonTemplate) -> DemonCard:
+        data = template.data
+        return cls.build(
+            template.name,
+            data.get("description", ""),
+            data.get("url", ""),
+            template.arcana.pretty_name,
+            data.get("stats", {}),
+            data.get("abilities", {}),
+            template.resistances,
+        )
+
+    @classmethod
+    def from_demon(cls, demon: Demon) -> DemonCard:
+        return cls.build(
+            demon.name,
+            demon.description,
+            demon.url,
+            demon.arcana,
+            demon._stats,
+            demon.abilities.to_json(),
+            {r.name: r.type.value for r in demon.resistances},
+        )
+
+    def to_embed(self, colour: Optional[discord.Colour] = None) -> discord.Embed:
+        embed = self.embed.copy()
+        embed.colour = colour
+        return embed
+
+
+class CardCache:
+    """Demon cards for the compendium's demons
+
+    Cards are made from the template they were built from, so a changed compendium
+    (which has new templates) gets new cards without anything having to be cleared
+    """
+
+    def __init__(self, capacity: int = CARD_CACHE_SIZE):
+        # {NAME: (TEMPLATE, CARD)}
+        self._cards: LRUCache[str, Tuple[DemonTemplate, DemonCard]] = LRUCache(capacity)
+
+    @property
+    def stats(self) -> CacheStats:
+        return self._cards.stats
+
+    def get(self, template: DemonTemplate) -> DemonCard:
+        cached = self._cards.get(template.name)
+        if cached is not None and cached[0] is template:
+            return cached[1]
+        card = DemonCard.from_template(template)
+        self._cards.set(template.name, (template, card))
+        return card
+
+    def clear(self) -> None:
+        self._cards.clear()
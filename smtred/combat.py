@@ -0,0 +1,417 @@
+"""
+Combat engine for SMT - Red
+
+This is the press turn system without any of the discord bits so battles can be
+stepped as fast as needed (tests, simulations) and `Session` just has to render it.
+
+Press turns work like SMT3:
+    - every side starts their turn with one icon per living party member
+    - a normal action uses up one icon (half icons go first)
+    - hitting a weakness, landing a crit, or passing turns a full icon into a half icon
+      (if there are only half icons left it uses one of those instead)
+    - missing or hitting something that nulls the element uses up two icons
+    - getting absorbed ends the turn outright
+
+`ma` skills (maragi, mabufu...) hit every enemy at once, their damage is worked out for the whole
+side in one go with the resistance matrix. The worst thing that happened decides the press turns,
+so one absorb ends the turn even if everyone else was weak to it.
+"""
+
+# Copyright (c) 2025 - Amy (jojo7791)
+# Licensed under MIT
+
+from __future__ import annotations
+
+import random
+from enum import Enum
+from typing import Dict, Final, FrozenSet, List, NamedTuple, Optional, Sequence, Tuple
+
+from .demons import CostType, Demon, Move, ResistEnum
+from .matrix import ResistanceMatrix, resisted_damage
+from .scheduler import ENEMY, PLAYER, TurnScheduler
+
+__all__: Final[Tuple[str, ...]] = (
+    "ATTACK",
+    "ENEMY",
+    "PASS",
+    "PLAYER",
+    "Action",
+    "Battle",
+    "BattleFinished",
+    "Combatant",
+    "Hit",
+    "Outcome",
+    "PressTurns",
+    "Result",
+    "action_for_move",
+)
+
+# Skill families, SMT names skills as <element><tier> (agi, agilao, agidyne...)
+# so the prefix is enough to know what element a skill is
+_SKILL_ELEMENTS: Final[Dict[str, str]] = {
+    "agi": "fire",
+    "maragi": "fire",
+    "bufu": "ice",
+    "mabufu": "ice",
+    "zio": "elec",
+    "mazio": "elec",
+    "zan": "wind",
+    "mazan": "wind",
+    "psi": "psy",
+    "mapsi": "psy",
+    "frei": "nuke",
+    "mafrei": "nuke",
+    "hama": "light",
+    "mahama": "light",
+    "mudo": "dark",
+    "mamudo": "dark",
+    "megido": "alimighty",
+}
+_SKILL_PREFIXES: Final[Tuple[str, ...]] = tuple(sorted(_SKILL_ELEMENTS, key=len, reverse=True))
+# These hit every enemy
+_ALL_TARGET_PREFIXES: Final[FrozenSet[str]] = frozenset(
+    ("maragi", "mabufu", "mazio", "mazan", "mapsi", "mafrei", "mahama", "mamudo")
+)
+_PHYSICAL: Final[Tuple[str, ...]] = ("phys", "pierce")
+CRIT_MULTIPLIER: Final[float] = 1.5
+
+
+class BattleFinished(RuntimeError):
+    """Gets raised when trying to act in a battle that already has a winner"""
+
+    pass
+
+
+class Outcome(Enum):
+    HIT = "hit"
+    WEAK = "weak"
+    CRIT = "crit"
+    STRONG = "strong"
+    MISS = "miss"
+    NULL = "null"
+    ABSORB = "absorb"
+    PASS = "pass"
+
+
+class Action(NamedTuple):
+    name: str
+    element: str
+    power: int
+    cost: int = 0
+    cost_type: CostType = CostType.FP
+    all_targets: bool = False
+
+
+ATTACK: Final[Action] = Action("attack", "phys", 10)
+PASS: Final[Action] = Action("pass", "", 0)
+
+
+def action_for_move(move: Move) -> Optional[Action]:
+    """Turn a demon's `Move` into an `Action`, None if it's not something you can attack with"""
+    if not isinstance(move.cost, int):
+        # "AUTO" moves are passive
+        return None
+    name = move.name.lower()
+    for prefix in _SKILL_PREFIXES:
+        if name.startswith(prefix):
+            # The longer the suffix the higher the tier (agi < agilao < agidyne)
+            power = 15 + (len(name) - len(prefix)) * 10
+            return Action(
+                move.name,
+                _SKILL_ELEMENTS[prefix],
+                power,
+                move.cost,
+                move.cost_type,
+                prefix in _ALL_TARGET_PREFIXES,
+            )
+    return None
+
+
+class PressTurns:
+    __slots__ = ("full", "half")
+
+    def __init__(self, full: int, half: int = 0):
+        self.full = full
+        self.half = half
+
+    def __repr__(self) -> str:
+        return f"PressTurns(full={self.full}, half={self.half})"
+
+    def __bool__(self) -> bool:
+        return self.full + self.half > 0
+
+    def use(self, amount: int = 1) -> None:
+        for _ in range(amount):
+            if self.half:
+                self.half -= 1
+            elif self.full:
+                self.full -= 1
+
+    def bonus(self) -> None:
+        if self.full:
+            self.full -= 1
+            self.half += 1
+        else:
+            self.use()
+
+    def end(self) -> None:
+        self.full = self.half = 0
+
+    def spend(self, outcome: Outcome) -> None:
+        if outcome in (Outcome.WEAK, Outcome.CRIT, Outcome.PASS):
+            self.bonus()
+        elif outcome in (Outcome.MISS, Outcome.NULL):
+            self.use(2)
+        elif outcome is Outcome.ABSORB:
+            self.end()
+        else:
+            self.use()
+
+
+class Combatant:
+    __slots__ = ("demon", "side", "hp", "sp", "max_hp", "max_sp", "actions")
+
+    def __init__(self, demon: Demon, side: int):
+        self.demon = demon
+        self.side = side
+        self.max_hp: int = demon._stats.get("hp", 1)  # type:ignore
+        self.max_sp: int = demon._stats.get("sp", 0)  # type:ignore
+        self.hp = self.max_hp
+        self.sp = self.max_sp
+        self.actions: Tuple[Action, ...] = (ATTACK,) + tuple(
+            action for action in map(action_for_move, demon.moves) if action is not None
+        )
+
+    def __repr__(self) -> str:
+        return (
+            f"<Combatant {self.demon.name} hp={self.hp}/{self.max_hp} sp={self.sp}/{self.max_sp}>"
+        )
+
+    @property
+    def alive(self) -> bool:
+        return self.hp > 0
+
+    def can_use(self, action: Action) -> bool:
+        if action.cost_type is CostType.HP:
+            # You can't kill yourself with a skill
+            return self.hp > action.cost
+        return self.sp >= action.cost
+
+    def pay(self, action: Action) -> None:
+        if action.cost_type is CostType.HP:
+            self.hp -= action.cost
+        else:
+            self.sp -= action.cost
+
+
+def _combatant_agility(combatant: Combatant) -> int:
+    return combatant.demon.abilities.agility
+
+
+class Hit(NamedTuple):
+    target: Combatant
+    outcome: Outcome
+    damage: int
+
+
+class Result(NamedTuple):
+    actor: Combatant
+    target: Optional[Combatant]
+    action: Action
+    outcome: Outcome
+    damage: int
+    # One for each enemy an all target skill went at, empty otherwise
+    hits: Tuple[Hit, ...] = ()
+
+
+def _press_outcome(hits: Sequence[Hit]) -> Outcome:
+    # The worst of them counts
+    outcomes = {hit.outcome for hit in hits}
+    for outcome in (Outcome.ABSORB, Outcome.NULL, Outcome.MISS, Outcome.WEAK):
+        if outcome in outcomes:
+            return outcome
+    return Outcome.HIT
+
+
+class Battle:
+    """A press turn battle between two groups of demons
+
+    Everything random goes through `rng` so the same seed and actions always play out the same.
+    `matrix` can be shared between battles, one gets made for the battle otherwise
+    """
+
+    def __init__(
+        self,
+        player: Sequence[Demon],
+        enemy: Sequence[Demon],
+        *,
+        seed: Optional[int] = None,
+        matrix: Optional[ResistanceMatrix] = None,
+    ):
+        self.rng = random.Random(seed)
+        self.matrix = ResistanceMatrix() if matrix is None else matrix
+        self.sides: Tuple[List[Combatant], List[Combatant]] = (
+            [Combatant(demon, PLAYER) for demon in player],
+            [Combatant(demon, ENEMY) for demon in enemy],
+        )
+        if not self.sides[PLAYER] or not self.sides[ENEMY]:
+            raise ValueError("Both sides need at least one demon")
+        self.round = 0
+        self.winner: Optional[int] = None
+        self.press_turns = PressTurns(0)
+        self.scheduler: TurnScheduler[Combatant] = TurnScheduler(_combatant_agility)
+        for side in self.sides:
+            for combatant in side:
+                self.scheduler.add(combatant, combatant.side)
+
+        self.side = self.scheduler.first_side()
+        self._start_turn(self.side)
+
+    def _living(self, side: int) -> List[Combatant]:
+        return [c for c in self.sides[side] if c.alive]
+
+    def _start_turn(self, side: int) -> None:
+        self.side = side
+        self.round += 1
+        self.scheduler.start_round(side)
+        self.press_turns = PressTurns(self.scheduler.count(side))
+
+    @property
+    def finished(self) -> bool:
+        return self.winner is not None
+
+    @property
+    def actor(self) -> Combatant:
+        actor = self.scheduler.peek(self.side)
+        if actor is None:
+            raise BattleFinished
+        return actor
+
+    def targets(self) -> List[Combatant]:
+        return self._living(ENEMY if self.side == PLAYER else PLAYER)
+
+    def usable_actions(self) -> List[Action]:
+        actor = self.actor
+        return [action for action in actor.actions if actor.can_use(action)]
+
+    def _hits(self, actor: Combatant, target: Combatant) -> bool:
+        attacker = actor.demon.abilities
+        hit_chance = 0.95 + (attacker.agility - target.demon.abilities.agility) / 100
+        return self.rng.random() <= min(0.99, max(0.5, hit_chance))
+
+    def _base(self, actor: Combatant, target: Combatant, action: Action) -> float:
+        attacker = actor.demon.abilities
+        stat = attacker.strength if action.element in _PHYSICAL else attacker.magic
+        return (action.power + stat * 2 - target.demon.abilities.vitality) * self.rng.uniform(
+            0.9, 1.1
+        )
+
+    @staticmethod
+    def _land(target: Combatant, resist: ResistEnum, damage: int) -> Outcome:
+        # `damage` is from `resisted_damage`, negative means it healed
+        if resist is ResistEnum.NULL:
+            return Outcome.NULL
+        if resist is ResistEnum.ABSORB:
+            target.hp = min(target.max_hp, target.hp - damage)
+            return Outcome.ABSORB
+        target.hp = max(0, target.hp - damage)
+        if resist is ResistEnum.WEAK:
+            return Outcome.WEAK
+        if resist is ResistEnum.STRONG:
+            return Outcome.STRONG
+        return Outcome.HIT
+
+    def _resolve(self, actor: Combatant, target: Combatant, action: Action) -> Tuple[Outcome, int]:
+        rng = self.rng
+        attacker = actor.demon.abilities
+        defender = target.demon.abilities
+
+        if not self._hits(actor, target):
+            return Outcome.MISS, 0
+
+        resist = target.demon.resistance(action.element)
+        if resist is ResistEnum.NULL:
+            return Outcome.NULL, 0
+
+        damage = resisted_damage(self._base(actor, target, action), resist)
+        if resist in (ResistEnum.ABSORB, ResistEnum.WEAK, ResistEnum.STRONG):
+            return self._land(target, resist, damage), damage
+
+        outcome = Outcome.HIT
+        if action.element in _PHYSICAL:
+            crit_chance = 0.05 + (attacker.luck - defender.luck) / 100
+            if rng.random() < min(0.5, max(0.01, crit_chance)):
+                outcome = Outcome.CRIT
+                damage = int(damage * CRIT_MULTIPLIER)
+        target.hp = max(0, target.hp - damage)
+        return outcome, damage
+
+    def _resolve_all(self, actor: Combatant, action: Action) -> Tuple[Hit, ...]:
+        """Resolve an all target skill against every living enemy at once (these can't crit)"""
+        targets = self.targets()
+        landed = [target for target in targets if self._hits(actor, target)]
+        rows = self.matrix.rows_for(target.demon for target in landed)
+        damage = self.matrix.damage(
+            action.element, rows, [self._base(actor, target, action) for target in landed]
+        )
+        resists = self.matrix.resists(action.element, rows)
+
+        results = dict(
+            (target, Hit(target, self._land(target, resist, amount), amount))
+            for target, resist, amount in zip(landed, resists, damage)
+        )
+        return tuple(results.get(target, Hit(target, Outcome.MISS, 0)) for target in targets)
+
+    def act(self, action: Action, target: Optional[Combatant] = None) -> Result:
+        """Have the current actor do `action` to `target`"""
+        if self.winner is not None:
+            raise BattleFinished
+        actor = self.actor
+
+        hits: Tuple[Hit, ...] = ()
+        if action is PASS:
+            outcome, damage = Outcome.PASS, 0
+        else:
+            # All target skills go at everyone, whoever was picked doesn't matter
+            if not action.all_targets and (
+                target is None or not target.alive or target.side == actor.side
+            ):
+                raise ValueError("That's not something you can target")
+            if not actor.can_use(action):
+                raise ValueError(f"{actor.demon.name} can't use {action.name} right now")
+            actor.pay(action)
+            if action.all_targets:
+                target = None
+                hits = self._resolve_all(actor, action)
+                outcome = _press_outcome(hits)
+                damage = sum(hit.damage for hit in hits)
+                hit_targets = [hit.target for hit in hits]
+            else:
+                outcome, damage = self._resolve(actor, target, action)
+                hit_targets = [target]
+            for hit_target in hit_targets:
+                if not hit_target.alive:
+                    self.scheduler.remove(hit_target)
+
+        self.scheduler.next(self.side)
+        self.press_turns.spend(outcome)
+        self._advance()
+        return Result(actor, target, action, outcome, damage, hits)
+
+    def _advance(self) -> None:
+        for side in (PLAYER, ENEMY):
+            if not self.scheduler.count(side):
+                self.winner = ENEMY if side == PLAYER else PLAYER
+                return
+        if not self.press_turns:
+            self._start_turn(ENEMY if self.side == PLAYER else PLAYER)
+
+    def auto_act(self) -> Result:
+        """Pick a random action and target for the current actor, used for enemies and simulations"""
+        return self.act(self.rng.choice(self.usable_actions()), self.rng.choice(self.targets()))
+
+    def run(self, max_rounds: int = 200) -> Optional[int]:
+        """Play the battle out with `auto_act`, returning the winner (None if it ran out of rounds)"""
+        while self.winner is None and self.round <= max_rounds:
+            self.auto_act()
+        return self.winner
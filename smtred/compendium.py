@@ -0,0 +1,212 @@
+# Copyright (c) 2025 - Amy (jojo7791)
+# Licensed under MIT
+
+from __future__ import annotations
+
+import bisect
+from dataclasses import dataclass
+from pathlib import Path
+from types import MappingProxyType
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Final,
+    FrozenSet,
+    Iterable,
+    Iterator,
+    List,
+    Mapping,
+    NamedTuple,
+    Optional,
+    Tuple,
+    Union,
+)
+
+from ._types import Self
+from .demons import ELEMENTS, Arcana, Demon, DemonNotFound, ResistEnum, _pack_resistances
+from .utils import load_json
+
+__all__: Final[Tuple[str, ...]] = ("Compendium", "DemonTemplate")
+
+
+def _freeze(obj: Any) -> Any:
+    if isinstance(obj, dict):
+        return MappingProxyType({k: _freeze(v) for k, v in obj.items()})
+    if isinstance(obj, list):
+        return tuple(_freeze(x) for x in obj)
+    return obj
+
+
+def _thaw(obj: Any) -> Any:
+    if isinstance(obj, Mapping):
+        return {k: _thaw(v) for k, v in obj.items()}
+    if isinstance(obj, tuple):
+        return [_thaw(x) for x in obj]
+    return obj
+
+
+@dataclass(frozen=True)
+class DemonTemplate:
+    """Read only copy of a demon as it is in the compendium
+
+    These are shared between everything that looks demons up,
+    so use `to_demon` when you need one you can mess with
+    """
+
+    name: str
+    level: int
+    arcana: Arcana
+    data: Mapping[str, Any]
+
+    @classmethod
+    def from_json(cls, name: str, data: dict) -> Self:
+        return cls(
+            name,
+            data.get("stats", {}).get("level", 0),
+            Arcana(data.get("arcana", "NONE")),
+            _freeze(data),
+        )
+
+    @property
+    def resistances(self) -> Mapping[str, str]:
+        return self.data.get("resistances", MappingProxyType({}))
+
+    def to_json(self) -> dict:
+        ret = _thaw(self.data)
+        ret["name"] = self.name
+        return ret
+
+    def to_demon(self) -> Demon:
+        return Demon.from_json(self.to_json())
+
+
+class _Entry(NamedTuple):
+    """The bits of a demon the indexes need, so they can be built without the full template"""
+
+    key: str
+    name: str
+    level: int
+    arcana: Arcana
+    resistances: Tuple[ResistEnum, ...]  # Packed in the order of `ELEMENTS`
+
+    @classmethod
+    def from_template(cls, template: DemonTemplate) -> _Entry:
+        return cls(
+            template.name.lower(),
+            template.name,
+            template.level,
+            template.arcana,
+            _pack_resistances(template.resistances),  # type:ignore
+        )
+
+
+class Compendium:
+    """All of the demons known to the cog
+
+    The demons are indexed by name, arcana, level, and resistance up front
+    and the templates themselves are only loaded the first time they're needed
+    """
+
+    def __init__(self, entries: Iterable[_Entry], loader: Callable[[str], DemonTemplate]):
+        self._loader = loader
+        self._templates: Dict[str, DemonTemplate] = {}
+
+        by_arcana: Dict[Arcana, List[_Entry]] = {}
+        by_resistance: Dict[Tuple[str, ResistEnum], List[str]] = {}
+        self._entries: Dict[str, _Entry] = {}
+        for entry in entries:
+            self._entries[entry.key] = entry
+            by_arcana.setdefault(entry.arcana, []).append(entry)
+            for element, resist in zip(ELEMENTS, entry.resistances):
+                by_resistance.setdefault((element, resist), []).append(entry.name)
+
+        # Sorted by level so fusion and encounters can bisect on them
+        self._by_arcana: Dict[Arcana, Tuple[str, ...]] = {
+            arcana: tuple(e.key for e in sorted(demons, key=lambda e: (e.level, e.key)))
+            for arcana, demons in by_arcana.items()
+        }
+        self._by_resistance: Dict[Tuple[str, ResistEnum], FrozenSet[str]] = {
+            key: frozenset(names) for key, names in by_resistance.items()
+        }
+
+        ordered = sorted(self._entries.values(), key=lambda e: (e.level, e.key))
+        self._by_level: Tuple[str, ...] = tuple(e.key for e in ordered)
+        self._levels: Tuple[int, ...] = tuple(e.level for e in ordered)
+
+    @classmethod
+    def from_json(cls, data: Dict[str, dict]) -> Self:
+        templates = {
+            name.lower(): DemonTemplate.from_json(name, demon) for name, demon in data.items()
+        }
+        return cls(map(_Entry.from_template, templates.values()), templates.__getitem__)
+
+    @classmethod
+    def from_path(cls, path: Union[str, Path]) -> Self:
+        with open(path) as fp:
+            return cls.from_json(load_json(fp))
+
+    def _template(self, key: str) -> DemonTemplate:
+        template = self._templates.get(key)
+        if template is None:
+            template = self._templates[key] = self._loader(key)
+        return template
+
+    def _templates_for(self, keys: Iterable[str]) -> Tuple[DemonTemplate, ...]:
+        return tuple(self._template(key) for key in keys)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, name: object) -> bool:
+        return isinstance(name, str) and name.lower() in self._entries
+
+    def __iter__(self) -> Iterator[DemonTemplate]:
+        return (self._template(key) for key in self._by_level)
+
+    def __getitem__(self, name: str) -> DemonTemplate:
+        key = name.lower()
+        if key not in self._entries:
+            raise DemonNotFound
+        return self._template(key)
+
+    def get(self, name: str) -> Optional[DemonTemplate]:
+        key = name.lower()
+        if key not in self._entries:
+            return None
+        return self._template(key)
+
+    def names(self) -> Tuple[str, ...]:
+        """Every demon's name, without loading any templates"""
+        return tuple(entry.name for entry in self._entries.values())
+
+    def get_demon(self, name: str) -> Optional[Demon]:
+        """Get a fresh `Demon` from the compendium, or None if it doesn't exist"""
+        template = self.get(name)
+        if template is None:
+            return None
+        return template.to_demon()
+
+    def by_arcana(self, arcana: Arcana) -> Tuple[DemonTemplate, ...]:
+        """All demons of an arcana, sorted by level"""
+        return self._templates_for(self._by_arcana.get(arcana, ()))
+
+    def in_order(self, start: int, stop: int) -> Tuple[DemonTemplate, ...]:
+        """The demons from `start` up to `stop` when they're all sorted by level
+
+        Only these templates get loaded, for paging through the whole compendium
+        """
+        return self._templates_for(self._by_level[start:stop])
+
+    def in_level_range(self, low: int, high: int) -> Tuple[DemonTemplate, ...]:
+        """All demons with a level between `low` and `high` (inclusive), sorted by level"""
+        start = bisect.bisect_left(self._levels, low)
+        stop = bisect.bisect_right(self._levels, high)
+        return self._templates_for(self._by_level[start:stop])
+
+    def with_resistance(self, element: str, resist: ResistEnum) -> FrozenSet[str]:
+        """The names of every demon with `resist` to `element`
+
+        e.g. `compendium.with_resistance("ice", ResistEnum.WEAK)`
+        """
+        return self._by_resistance.get((element, resist), frozenset())
@@ -8,7 +8,9 @@ from typing import Final
 __all__ = ("config_structure", "__author__", "__version__", "CONTRACT")
 
 config_structure: Final[dict] = {
-    "demons": [],  # List[Demon]
+    "demons": [],  # Old saved demons, these get moved to `RosterStore`
+    "slots": {},  # {SLOT: COMPENDIUM_ID} see `roster.py`
+    "next_slot": 0,
     "items": [],  # TODO(Amy) maybe dict with types?
     "registered": [],  # Will be their name
     "stats": {
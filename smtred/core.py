@@ -3,25 +3,50 @@
 
 from __future__ import annotations
 
+import asyncio
+import functools
 import logging
-from typing import TYPE_CHECKING, Dict, Final, Tuple, Union
+import time
+from typing import AsyncIterator, Final, List, Optional, Tuple
 
 import discord
-from redbot.core import Config, commands
+from redbot.core import Config, app_commands, commands
 from redbot.core.bot import Red
-from redbot.core.data_manager import bundled_data_path
+from redbot.core.data_manager import bundled_data_path, cog_data_path
 
 from ._types import Context
+from .cache import load_compendium
+from .cards import CardCache, DemonCard
+from .compendium import Compendium
 from .constants import CONTRACT, __author__, __version__, config_structure
 from .demons import Demon
+from .encounters import EncounterGenerator
+from .fusion import FusionEngine
 from .macca import Macca, MaccaBank  # noqa
-from .modals import Menu, Page, RegisterView  # noqa
-from .utils import load_json
+from .matrix import ResistanceMatrix
+from .modals import IndexedSource, Menu, RegisterView, StreamSource
+from .names import NameIndex, load_aliases
+from .players import PlayerCache
+from .roster import RosterStore
+from .session import SessionManager
+from .snapshot import SnapshotStore
+from .simulate import parse_enemy, parse_party, simulate_async
 
 __all__: Final[Tuple[str]] = ("ShinMegamiTensei",)
 
 log = logging.getLogger("red.jojocogs.smtred")
 
+# How long commands will wait for the compendium to finish loading
+READY_TIMEOUT: Final[float] = 10.0
+# How often `simulate` updates its message
+SIMULATE_UPDATE_INTERVAL: Final[float] = 2.0
+# How many users `leaderboard` shows and how many go on each page
+LEADERBOARD_PAGE_SIZE: Final[int] = 10
+COMPENDIUM_PAGE_SIZE: Final[int] = 15
+FUSE_PATH_MAX_DEPTH: Final[int] = 5
+# The most encounters `encounter` will roll at once
+ENCOUNTER_MAX_ROLLS: Final[int] = 10
+
 
 class ShinMegamiTensei(commands.Cog):
     """A mixture of Shin Megami Tensei and Persona
@@ -32,14 +57,30 @@ class ShinMegamiTensei(commands.Cog):
     def __init__(self, bot: Red) -> None:
         self.bot = bot
         self.config = Config.get_conf(self, 544974305445019651, force_registration=True)
-        self.config.register_global(jack_frost_send=True)
+        # 0 means every Macca change is written straight away
+        self.config.register_global(
+            jack_frost_send=True, macca_flush_interval=0.0, warm_up=True, roster_migrated=False
+        )
         self.config.register_user(**config_structure)
 
         self.config.init_custom("MACCA_BANK", 1)
         self.config.register_custom("MACCA_BANK", macca=0)
+        # (USER_ID, SLOT) -> one saved demon, see `roster.py`
+        self.config.init_custom("ROSTER", 2)
+        self.config.register_custom("ROSTER")
 
         self.macca_bank = MaccaBank(self.config)
-        self._demons: Dict[str, Union[str, int]] = {}
+        self.players = PlayerCache(self.config)
+        self.roster = RosterStore(self.config, self.players)
+        self.sessions = SessionManager(bot)
+        self.cards = CardCache()
+        self.compendium = Compendium.from_json({})
+        self.fusion = FusionEngine(self.compendium)
+        self.names = NameIndex(())
+        self.encounters = EncounterGenerator()
+        self.resistances = ResistanceMatrix()
+        self._ready = asyncio.Event()
+        self._load_error: Optional[BaseException] = None
 
         # Initalize demon list
         self._task = self.bot.loop.create_task(self.init())
@@ -47,6 +88,9 @@ class ShinMegamiTensei(commands.Cog):
     async def cog_unload(self) -> None:
         if self._task:
             self._task.cancel()
+        await self.sessions.close()
+        await self.macca_bank.close()
+        await self.players.flush()
 
     def cog_check(self, ctx: Context) -> bool:
         return ctx.author.id == 544974305445019651
@@ -63,11 +107,102 @@ class ShinMegamiTensei(commands.Cog):
         )
 
     async def init(self) -> None:
+        # Reading and parsing happens in an executor so the rest of the bot doesn't wait on it
+        path = bundled_data_path(self) / "demons.json"
+        start = time.perf_counter()
         try:
-            with open(bundled_data_path(self) / "demons.json") as fp:
-                self._demons = load_json(fp)
+            loop = asyncio.get_running_loop()
+            self.compendium = await loop.run_in_executor(None, load_compendium, path)
+            self.fusion = await loop.run_in_executor(None, FusionEngine, self.compendium)
+            self.names = await loop.run_in_executor(
+                None,
+                lambda: NameIndex.from_compendium(
+                    self.compendium, load_aliases(bundled_data_path(self) / "aliases.json")
+                ),
+            )
+            self.encounters = await loop.run_in_executor(None, EncounterGenerator, self.compendium)
+            self.resistances = await loop.run_in_executor(None, ResistanceMatrix, self.compendium)
         except Exception as e:
-            log.debug("Couldn't open file", exc_info=e)
+            self._load_error = e
+            log.error(
+                "Couldn't load the compendium from %s after %.2fms",
+                path,
+                (time.perf_counter() - start) * 1000,
+                exc_info=e,
+            )
+        else:
+            log.info(
+                "Compendium ready with %d demons after %.2fms",
+                len(self.compendium),
+                (time.perf_counter() - start) * 1000,
+            )
+            self.cards.clear()
+            self.sessions.matrix = self.resistances
+            # Battles from before a reload get picked back up when their user acts
+            self.sessions.snapshots = SnapshotStore(
+                cog_data_path(self) / "battles", self.compendium
+            )
+        finally:
+            self._ready.set()
+
+        self.sessions.start_reaper()
+        await self.macca_bank.set_flush_interval(await self.config.macca_flush_interval())
+        await self.warm_up(await self.config.warm_up())
+        if not await self.config.roster_migrated():
+            await self.migrate_rosters()
+
+    async def migrate_rosters(self) -> None:
+        """Move everyone's `demons` list into the ROSTER group, this only has to happen once"""
+        start = time.perf_counter()
+        compendium = self.compendium if self._load_error is None else None
+        users = moved = 0
+        for user_id, data in (await self.config.all_users()).items():
+            if not data.get("demons"):
+                continue
+            moved += await self.roster.migrate(user_id, compendium)
+            users += 1
+        await self.config.roster_migrated.set(True)
+        log.info(
+            "Moved %d demons from %d rosters in %.2fms",
+            moved,
+            users,
+            (time.perf_counter() - start) * 1000,
+        )
+
+    async def warm_up(self, enabled: bool) -> None:
+        """Read every player and bank balance in one go so nobody's first command hits Config
+
+        Only as many as fit in the caches get loaded, the rest are read when they're needed
+        """
+        start = time.perf_counter()
+        players = 0
+        if enabled:
+            players = self.players.warm(await self.config.all_users())
+        # The leaderboard needs the whole bank either way
+        balances = await self.macca_bank.load(warm=enabled)
+        log.info(
+            "Warmed up %d players and %d balances in %.2fms",
+            players,
+            balances,
+            (time.perf_counter() - start) * 1000,
+        )
+
+    async def wait_until_ready(self, timeout: float = READY_TIMEOUT) -> bool:
+        """Wait for the compendium to load, returning False if it timed out or failed"""
+        try:
+            await asyncio.wait_for(self._ready.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        return self._load_error is None
+
+    async def _ensure_ready(self, ctx: commands.Context) -> bool:
+        if await self.wait_until_ready():
+            return True
+        if self._load_error is not None:
+            await ctx.send("The Velvet Room is closed right now, something went wrong loading it")
+        else:
+            await ctx.send("The Velvet Room is still opening its doors, try again in a moment")
+        return False
 
     @commands.group(name="shinmegamitensei", aliases=["smt"])
     async def shin_megami_tensei(self, ctx: commands.Context) -> None:
@@ -76,31 +211,199 @@ class ShinMegamiTensei(commands.Cog):
 
     @shin_megami_tensei.command(name="testdemon")
     async def test_demon(self, ctx: commands.Context, demon_name: str) -> None:
-        demon = self._demons.get(demon_name)
-        if not demon:
+        if not await self._ensure_ready(ctx):
+            return
+        name = self.names.get(demon_name)
+        if name is None:
+            matches = self.names.fuzzy(demon_name, 3)
+            if not matches:
+                await ctx.send("Can't find that demon, buddy")
+            else:
+                await ctx.send(f"Can't find that demon, buddy. Did you mean {', '.join(matches)}?")
+            return
+        await self.send_card(ctx, self.cards.get(self.compendium[name]))
+
+    @app_commands.command(name="demon")
+    @app_commands.describe(name="The demon to look up")
+    async def slash_demon(self, interaction: discord.Interaction, name: str) -> None:
+        """Look up a demon in the compendium"""
+        if not await self.wait_until_ready():
+            await interaction.response.send_message(
+                "The Velvet Room isn't open right now, try again in a moment", ephemeral=True
+            )
+            return
+        found = self.names.get(name) or next(iter(self.names.fuzzy(name, 1)), None)
+        if found is None:
+            await interaction.response.send_message("Can't find that demon, buddy", ephemeral=True)
+            return
+        card = self.cards.get(self.compendium[found])
+        channel = interaction.channel
+        if not await self.bot.embed_requested(channel):  # type:ignore
+            await interaction.response.send_message(card.text)
+            return
+        colour = await self.bot.get_embed_colour(channel)  # type:ignore
+        await interaction.response.send_message(embed=card.to_embed(colour))
+
+    @slash_demon.autocomplete("name")
+    async def slash_demon_autocomplete(
+        self, interaction: discord.Interaction, current: str
+    ) -> List[app_commands.Choice[str]]:
+        return [
+            app_commands.Choice(name=name, value=name) for name in self.names.complete(current)
+        ]
+
+    @shin_megami_tensei.command(name="simulate")
+    @commands.is_owner()
+    async def smt_simulate(self, ctx: commands.Context, battles: int, *, matchup: str) -> None:
+        """Simulate a bunch of battles between two parties
+
+        The matchup is the player's party and the enemy party split by `vs`, e.g.
+        `[p]smt simulate 100000 pixie, jack frost vs jack frost`
+        The enemy can be a level too, then every battle is a random encounter for that level
+        `[p]smt simulate 100000 pixie vs level 5`
+        """
+        if not await self._ensure_ready(ctx):
+            return
+        player, sep, enemy = matchup.partition(" vs ")
+        player_party, enemy_party = parse_party(player), parse_enemy(enemy)
+        if not sep or not player_party or not enemy_party:
+            await ctx.send("The matchup needs to look like `pixie, jack frost vs jack frost`")
+            return
+        names = player_party if isinstance(enemy_party, int) else (*player_party, *enemy_party)
+        for name in names:
+            if name not in self.compendium:
+                await ctx.send(f"Can't find {name}, buddy")
+                return
+        if battles < 1:
+            await ctx.send("You need at least one battle")
+            return
+
+        msg = await ctx.send(f"Simulating {battles} battles...")
+        last_update = time.monotonic()
+        stats = None
+        async for stats in simulate_async(
+            bundled_data_path(self) / "demons.json", player_party, enemy_party, battles
+        ):
+            if time.monotonic() - last_update >= SIMULATE_UPDATE_INTERVAL:
+                last_update = time.monotonic()
+                await msg.edit(content=f"Simulating {battles} battles...\n{stats}")
+        await msg.edit(content=f"Finished simulating {battles} battles\n{stats}")
+
+    @shin_megami_tensei.command(name="encounter")
+    @commands.is_owner()
+    async def smt_encounter(self, ctx: commands.Context, level: int, count: int = 1) -> None:
+        """Roll some random encounters for a level, to see what players would run into"""
+        if not await self._ensure_ready(ctx):
+            return
+        if level < 1:
+            await ctx.send("The level needs to be at least 1")
+            return
+        count = max(1, min(count, ENCOUNTER_MAX_ROLLS))
+        parties = self.encounters.draw_many([level] * count)
+        if not any(parties):
+            await ctx.send("There aren't any demons to run into")
+            return
+        lines = "\n".join(f"{i}. {', '.join(party)}" for i, party in enumerate(parties, 1))
+        await ctx.send(f"Encounters for level {level}\n{lines}")
+
+    @shin_megami_tensei.command(name="fuse-path", aliases=["fusepath"])
+    async def smt_fuse_path(
+        self, ctx: commands.Context, depth: Optional[int] = 3, *, demon_name: str
+    ) -> None:
+        """Find the cheapest way to fuse a demon from the demons you have
+
+        `depth` is how many fusions deep to look, up to 5
+        """
+        if not await self._ensure_ready(ctx):
+            return
+        if demon_name not in self.compendium:
             await ctx.send("Can't find that demon, buddy")
             return
-        demon["name"] = demon_name
-        if TYPE_CHECKING:
-            assert isinstance(demon, dict)
-        dem = Demon.from_json(demon)
-        await self.send_demon(ctx, dem)
+        depth = max(1, min(depth or 3, FUSE_PATH_MAX_DEPTH))
+        roster = list((await self.roster.ids(ctx.author)).values())
+
+        # Even shallow searches can take a while on a big roster, the loop never waits on one
+        async with ctx.typing():
+            path = await asyncio.get_running_loop().run_in_executor(
+                None,
+                functools.partial(self.fusion.fusion_path, roster, demon_name, max_depth=depth),
+            )
+        if path is None:
+            await ctx.send(f"Igor can't find a way to make {demon_name} within {depth} fusions")
+            return
+        if not path.steps:
+            await ctx.send(f"You already have {demon_name}")
+            return
+        steps = "\n".join(
+            f"{i}. {first} + {second} = {result}"
+            for i, (first, second, result) in enumerate(path.steps, 1)
+        )
+        await ctx.send(f"{steps}\n\nTotal cost: {Macca(path.cost)}")
+
+    @shin_megami_tensei.command(name="flushinterval")
+    @commands.is_owner()
+    async def smt_flush_interval(
+        self, ctx: commands.Context, seconds: Optional[float] = None
+    ) -> None:
+        """Set how often Macca changes get saved
+
+        0 saves every change straight away, anything higher saves them in batches
+        but a crash can lose up to that many seconds of changes.
+        Run without a number to see the current setting and how flushing is going
+        """
+        if seconds is None:
+            interval = self.macca_bank.flush_interval
+            await ctx.send(
+                f"Macca gets saved {f'every {interval} seconds' if interval else 'straight away'}"
+                f"\n{self.macca_bank.flush_stats}"
+            )
+            return
+        seconds = max(0.0, seconds)
+        await self.config.macca_flush_interval.set(seconds)
+        await self.macca_bank.set_flush_interval(seconds)
+        await ctx.send(
+            f"Macca will be saved {f'every {seconds} seconds' if seconds else 'straight away'}"
+        )
+
+    @shin_megami_tensei.command(name="warmup")
+    @commands.is_owner()
+    async def smt_warm_up(self, ctx: commands.Context, enabled: bool) -> None:
+        """Set whether player data gets loaded all at once when the cog loads"""
+        await self.config.warm_up.set(enabled)
+        await ctx.send(f"Warm up is now {'on' if enabled else 'off'}")
+
+    @shin_megami_tensei.command(name="cachestats")
+    @commands.is_owner()
+    async def smt_cache_stats(self, ctx: commands.Context) -> None:
+        """See how the caches are doing"""
+        await ctx.send(
+            f"**Macca bank:** {self.macca_bank.cache_stats}\n"
+            f"**Players:** {self.players.stats}\n"
+            f"**Demon cards:** {self.cards.stats}"
+        )
+
+    @shin_megami_tensei.command(name="sessions")
+    @commands.is_owner()
+    async def smt_sessions(self, ctx: commands.Context) -> None:
+        """See how many battles are going"""
+        await ctx.send(f"**Battles:** {self.sessions.stats}")
 
     @shin_megami_tensei.command(name="register")
     async def smt_register(self, ctx: commands.Context) -> None:
         """Start a contract with Igor"""
-        registered = await self.config.user(ctx.author).registered()
+        registered = (await self.players.get(ctx.author)).registered
         if registered:
             first, last = registered
             actual = CONTRACT.format(rname=first, lname=last)
-            await self.send(ctx, actual)
+            await ctx.send(actual)
             return
         view = RegisterView(ctx)
         await view.start()
         await view.wait()
         first_name = view._first_name
         last_name = view._last_name
-        await self.config.user(ctx.author).registered.set([first_name, last_name])
+        async with self.players.edit(ctx.author) as profile:
+            profile.registered = [first_name, last_name]
         await ctx.send(
             "Good. All signed and sealed. Now let's begin the transfusion. "
             "Oh, don't you worry. Whatever happens... You may think it all a mere bad dream..."
@@ -111,30 +414,97 @@ class ShinMegamiTensei(commands.Cog):
     @shin_megami_tensei.command(name="bank")
     async def smt_bank(self, ctx: commands.Context) -> None:
         """See the amount of Macca you have"""
-        if not await self.config.user(ctx.author).registered():
+        if not (await self.players.get(ctx.author)).registered:
             await ctx.send(f"You are not registered yet, use `{ctx.prefix}smt register`")
             return
         macca = await self.macca_bank.get_user_amount(ctx.author)
         await ctx.send(f"You have {macca}")
 
+    @shin_megami_tensei.command(name="leaderboard", aliases=["lb"])
+    async def smt_leaderboard(self, ctx: commands.Context) -> None:
+        """See who has the most Macca"""
+        leaderboard = self.macca_bank.leaderboard
+        if not leaderboard.seeded:
+            await ctx.send("The leaderboard is still being put together, try again in a moment")
+            return
+        if not len(leaderboard):
+            await ctx.send("Nobody has any Macca yet")
+            return
+
+        async def load(index: int) -> str:
+            # Pages are made as they're shown so the whole leaderboard never has to be formatted
+            offset = index * LEADERBOARD_PAGE_SIZE
+            lines = []
+            for place, (user_id, macca) in enumerate(
+                leaderboard.top(LEADERBOARD_PAGE_SIZE, offset), offset + 1
+            ):
+                user = self.bot.get_user(user_id)
+                lines.append(f"{place}. {user.name if user else user_id}: {Macca(macca)}")
+            return "\n".join(lines) or "Nobody down here anymore"
+
+        count = -(-len(leaderboard) // LEADERBOARD_PAGE_SIZE)
+        rank = leaderboard.rank(ctx.author.id)
+        footer = f"You are #{rank} of {len(leaderboard)}" if rank else None
+        await Menu.start(
+            ctx, IndexedSource(ctx, count, load, title="Macca leaderboard", footer=footer)
+        )
+
+    @shin_megami_tensei.command(name="compendium")
+    async def smt_compendium(self, ctx: commands.Context) -> None:
+        """Look through every demon in the compendium"""
+        if not await self._ensure_ready(ctx):
+            return
+        compendium = self.compendium
+        if not len(compendium):
+            await ctx.send("The compendium is empty")
+            return
+
+        async def load(index: int) -> str:
+            start = index * COMPENDIUM_PAGE_SIZE
+            return "\n".join(
+                f"Lv {template.level} **{template.name}** ({template.arcana.pretty_name})"
+                for template in compendium.in_order(start, start + COMPENDIUM_PAGE_SIZE)
+            )
+
+        count = -(-len(compendium) // COMPENDIUM_PAGE_SIZE)
+        await Menu.start(
+            ctx,
+            IndexedSource(
+                ctx, count, load, title="Compendium", footer=f"{len(compendium)} demons"
+            ),
+        )
+
+    @shin_megami_tensei.command(name="roster")
+    async def smt_roster(self, ctx: commands.Context) -> None:
+        """Look through the demons you have"""
+        if not await self._ensure_ready(ctx):
+            return
+        ids = await self.roster.ids(ctx.author)
+        if not ids:
+            await ctx.send("You don't have any demons yet")
+            return
+        compendium = self.compendium
+
+        async def pages() -> AsyncIterator[str]:
+            # Rows are only read as far as someone pages
+            async for page in self.roster.pages(ctx.author, compendium):
+                yield "\n".join(
+                    f"`{slot}` **{demon.name}** ({demon.arcana})" for slot, demon in page
+                )
+
+        try:
+            await Menu.start(
+                ctx, StreamSource(ctx, pages, title="Your demons", footer=f"{len(ids)} demons")
+            )
+        except IndexError:
+            # Every demon they have is gone from the compendium
+            await ctx.send("You don't have any demons yet")
+
     async def send_demon(self, ctx: commands.Context, demon: Demon) -> None:
+        await self.send_card(ctx, DemonCard.from_demon(demon))
+
+    async def send_card(self, ctx: commands.Context, card: DemonCard) -> None:
         if not await ctx.embed_requested():
-            await ctx.send(
-                f"# Demon {demon.name}\n\n"
-                f"## Stats\n{demon._stats}\n\n"
-                f"## Abilities\n{demon.abilities}\n\n"
-                f"## Arcana\n{demon.arcana}\n\n"
-                f"## Resistances\n{demon.resistances}"
-            )
+            await ctx.send(card.text)
             return
-        embed = discord.Embed(
-            title=f"Demon {demon.name}",
-            colour=await ctx.embed_colour(),
-            description=demon.description,
-        )
-        embed.set_image(url=demon.url)
-        embed.add_field(name="Stats", value=demon._stats)
-        embed.add_field(name="Abilities", value=demon.abilities)
-        embed.add_field(name="Arcana", value=demon.arcana)
-        embed.add_field(name="Resistances", value=demon.resistances)
-        await ctx.send(embed=embed)
+        await ctx.send(embed=card.to_embed(await ctx.embed_colour()))
@@ -3,13 +3,15 @@
 
 from __future__ import annotations
 
+import sys
 from dataclasses import dataclass
 from enum import Enum
-from typing import Dict, Final, Iterable, List, Optional, Tuple, Union, overload
+from typing import Dict, Final, Iterable, List, Tuple, Union
 
 import discord
 
 from ._types import Self
+from .scheduler import PLAYER, TurnScheduler
 
 __all__: Final[Tuple[str, ...]] = (
     "Abilities",
@@ -17,6 +19,7 @@ __all__: Final[Tuple[str, ...]] = (
     "CostType",
     "Demon",
     "DemonNotFound",
+    "ELEMENTS",
     "Move",
 )
 
@@ -42,13 +45,31 @@ class CostType(Enum):
     HP = "hp"
 
 
-@dataclass
+@dataclass(frozen=True)
 class Move:
+    __slots__ = ("name", "cost", "cost_type", "level")
+
     name: str
-    cost: int
+    cost: Union[int, str]
     cost_type: CostType
     level: int
 
+    @classmethod
+    def get(cls, name: str, cost: Union[int, str], cost_type: CostType, level: int) -> Move:
+        """Get the shared `Move` for this data, creating it if it hasn't been seen yet
+
+        Most demons learn the same moves, so there's no reason for each of them to have their own
+        """
+        key = (name, cost, cost_type, level)
+        move = _MOVES.get(key)
+        if move is None:
+            move = _MOVES[key] = cls(sys.intern(name), cost, cost_type, level)
+        return move
+
+
+# {(NAME, COST, COST_TYPE, LEVEL): Move}
+_MOVES: Dict[Tuple[str, Union[int, str], CostType, int], Move] = {}
+
 
 class Arcana(Enum):
     """The arcana is the means by which all is revealed"""
@@ -101,13 +122,34 @@ def _to_rmn(num: int) -> str:
     return result
 
 
-@dataclass
 class Abilities:
-    strength: int = 5
-    magic: int = 5
-    vitality: int = 5
-    agility: int = 5
-    luck: int = 5
+    __slots__ = ("strength", "magic", "vitality", "agility", "luck")
+
+    def __init__(
+        self,
+        strength: int = 5,
+        magic: int = 5,
+        vitality: int = 5,
+        agility: int = 5,
+        luck: int = 5,
+    ):
+        self.strength = strength
+        self.magic = magic
+        self.vitality = vitality
+        self.agility = agility
+        self.luck = luck
+
+    def __repr__(self) -> str:
+        inner = ", ".join(f"{name}={getattr(self, name)!r}" for name in self.__slots__)
+        return f"Abilities({inner})"
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, Abilities):
+            return NotImplemented
+        return self.to_json() == other.to_json()
+
+    def to_json(self) -> Dict[str, int]:
+        return {name: getattr(self, name) for name in self.__slots__}
 
 
 class ResistEnum(Enum):
@@ -124,7 +166,51 @@ class Resistances:
     type: ResistEnum
 
 
+# The order resistances are packed in, see `data/structure.md`
+ELEMENTS: Final[Tuple[str, ...]] = (
+    "phys",
+    "pierce",
+    "fire",
+    "ice",
+    "elec",
+    "wind",
+    "psy",
+    "nuke",
+    "light",
+    "dark",
+    "alimighty",
+)
+_ELEMENT_INDEX: Final[Dict[str, int]] = {element: i for i, element in enumerate(ELEMENTS)}
+# {PACKED_RESISTANCES: PACKED_RESISTANCES} so demons with the same resistances share one tuple
+_RESISTANCES: Dict[Tuple[ResistEnum, ...], Tuple[ResistEnum, ...]] = {}
+
+
+def _pack_resistances(resistances: Dict[str, str]) -> Tuple[ResistEnum, ...]:
+    packed = [ResistEnum.NONE] * len(ELEMENTS)
+    for element, actual in resistances.items():
+        try:
+            index = _ELEMENT_INDEX[element]
+        except KeyError:
+            raise ValueError(f"Unknown element {element!r}") from None
+        packed[index] = ResistEnum(actual)
+    key = tuple(packed)
+    return _RESISTANCES.setdefault(key, key)
+
+
 class Demon:
+    __slots__ = (
+        "name",
+        "description",
+        "url",
+        "_arcana",
+        "abilities",
+        "_stats",
+        "exp",
+        "macca",
+        "_resistances",
+        "moves",
+    )
+
     def __init__(
         self,
         name: str,
@@ -142,35 +228,37 @@ class Demon:
         self.description = description
         self.url = url
         self._arcana = Arcana(arcana)
-        self.arcana = self._arcana.pretty_name
-
-        # We'll keep a backup of abilities for export
-        # and then have the "public" be `Abilities`
-        self._abilities = abilities
         self.abilities = Abilities(**abilities)
 
         self._stats = stats
         self.exp = exp
         self.macca = macca
-        self._resistances = resistances
-        res: List[Resistances] = []
-        for resistance, actual in resistances.items():
-            res.append(Resistances(resistance, ResistEnum(actual)))
-        self.resistances = res
-
-        self._moves = moves
-        # This is for public access of the moves
-        _moves: List[Move] = []
-        for move_name, move_data in moves.items():
-            _moves.append(
-                Move(
-                    move_name,
-                    move_data["cost"],  # type:ignore
-                    CostType(move_data["cost_type"]),
-                    move_data["level"],  # type:ignore
-                )
+        # Packed in the order of `ELEMENTS`
+        self._resistances = _pack_resistances(resistances)
+
+        self.moves: Tuple[Move, ...] = tuple(
+            Move.get(
+                move_name,
+                move_data["cost"],
+                CostType(move_data["cost_type"]),
+                move_data["level"],  # type:ignore
             )
-        self.moves = _moves
+            for move_name, move_data in moves.items()
+        )
+
+    @property
+    def arcana(self) -> str:
+        return self._arcana.pretty_name
+
+    @property
+    def resistances(self) -> List[Resistances]:
+        return [
+            Resistances(element, actual) for element, actual in zip(ELEMENTS, self._resistances)
+        ]
+
+    def resistance(self, element: str) -> ResistEnum:
+        """Get this demon's resistance to an element"""
+        return self._resistances[_ELEMENT_INDEX[element]]
 
     def higher_agility(self, other: Demon) -> bool:
         if not isinstance(other, Demon):
@@ -197,12 +285,21 @@ class Demon:
         return {
             "name": self.name,
             "stats": self._stats,
-            "abilities": self._abilities,
-            "arcana": self._arcana,
+            "abilities": self.abilities.to_json(),
+            "arcana": self._arcana.value,
             "exp": self.exp,
             "macca": self.macca,
-            "resistances": self._resistances,
-            "moves": self._moves,
+            "resistances": {
+                element: actual.value for element, actual in zip(ELEMENTS, self._resistances)
+            },
+            "moves": {
+                move.name: {
+                    "level": move.level,
+                    "cost": move.cost,
+                    "cost_type": move.cost_type.value,
+                }
+                for move in self.moves
+            },
             "url": self.url,
             "description": self.description,
         }
@@ -211,28 +308,27 @@ class Demon:
 class Party:
     def __init__(self, user: discord.User, demons: Iterable[Demon]):
         self.user = user
-        self._demons = demons
-        self.current_demon = self._get_next_demon(True)
+        self._demons = list(demons)
+        self._scheduler: TurnScheduler[Demon] = TurnScheduler()
+        for demon in self._demons:
+            self._scheduler.add(demon, PLAYER)
         self.turns = len(self._demons) + 1
 
-    @overload
-    def _get_next_demon(self) -> Demon: ...
+    @property
+    def current_demon(self) -> Demon:
+        """The fastest demon in the party"""
+        demon = self._scheduler.fastest(PLAYER)
+        if demon is None:
+            raise DemonNotFound
+        return demon
 
-    @overload
-    def _get_next_demon(self, initial: bool = True) -> Demon: ...
+    def add(self, demon: Demon) -> None:
+        self._demons.append(demon)
+        self._scheduler.add(demon, PLAYER)
 
-    def _get_next_demon(self, initial: bool = False) -> Demon:
-        hit: Optional[Demon] = None if initial else self.current_demon
-        for demon in self._demons:
-            if not hit:
-                hit = demon
-                continue
-            if not hit.higher_agility(demon):
-                continue
-            hit = demon
-        if not hit:
-            raise DemonNotFound
-        return hit
+    def remove(self, demon: Demon) -> None:
+        self._demons.remove(demon)
+        self._scheduler.remove(demon)
 
     def sorted(self, *, reversed: bool = False) -> Party:
         """Sorts demons by their agility stat"""
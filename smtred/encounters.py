@@ -0,0 +1,182 @@
+"""
+Random encounters that get harder as players level up
+
+Demons are split into level bands and each band (and each arcana within a band)
+gets a Walker alias table, so picking a demon is two random numbers no matter how big
+the compendium is. Tougher demons in a band show up less often than weaker ones.
+
+Adding demons only marks their band as stale, it's rebuilt the next time it's drawn from.
+"""
+
+# Copyright (c) 2025 - Amy (jojo7791)
+# Licensed under MIT
+
+from __future__ import annotations
+
+import random
+from typing import Dict, Final, List, Optional, Sequence, Set, Tuple, Union
+
+from .compendium import Compendium
+from .demons import Arcana
+
+__all__: Final[Tuple[str, ...]] = ("AliasTable", "EncounterGenerator")
+
+# How many levels each band covers, 1-5, 6-10, ...
+BAND_SIZE: Final[int] = 5
+# The most demons an encounter can have
+MAX_PARTY_SIZE: Final[int] = 3
+
+_Key = Union[int, Tuple[int, Arcana]]
+
+
+class AliasTable:
+    """Weighted random picks in constant time (Walker's alias method)"""
+
+    __slots__ = ("items", "_prob", "_alias")
+
+    def __init__(self, items: Sequence[str], weights: Sequence[float]):
+        if not items or len(items) != len(weights):
+            raise ValueError("Need one weight for each item, and at least one item")
+        count = len(items)
+        total = sum(weights)
+        if total <= 0:
+            raise ValueError("The weights have to add up to more than 0")
+        self.items: Tuple[str, ...] = tuple(items)
+        scaled = [weight * count / total for weight in weights]
+        self._prob = [1.0] * count
+        self._alias = list(range(count))
+
+        small = [i for i, p in enumerate(scaled) if p < 1.0]
+        large = [i for i, p in enumerate(scaled) if p >= 1.0]
+        while small and large:
+            less, more = small.pop(), large.pop()
+            self._prob[less] = scaled[less]
+            self._alias[less] = more
+            scaled[more] -= 1.0 - scaled[less]
+            (small if scaled[more] < 1.0 else large).append(more)
+        # Whatever's left is 1 give or take some float error
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def draw(self, rng: random.Random) -> str:
+        i = int(rng.random() * len(self.items))
+        return self.items[i] if rng.random() < self._prob[i] else self.items[self._alias[i]]
+
+    def draw_many(self, rng: random.Random, amount: int) -> List[str]:
+        # Everything's pulled into locals, this is what the simulator uses
+        items, prob, alias, rand = self.items, self._prob, self._alias, rng.random
+        count = len(items)
+        ret = []
+        for _ in range(amount):
+            i = int(rand() * count)
+            ret.append(items[i] if rand() < prob[i] else items[alias[i]])
+        return ret
+
+
+class EncounterGenerator:
+    def __init__(
+        self,
+        compendium: Optional[Compendium] = None,
+        *,
+        band_size: int = BAND_SIZE,
+        seed: Optional[int] = None,
+    ):
+        self.band_size = band_size
+        self.rng = random.Random(seed)
+        # {BAND: {NAME: LEVEL}} and {(BAND, ARCANA): {NAME: LEVEL}}
+        self._pools: Dict[_Key, Dict[str, int]] = {}
+        self._tables: Dict[_Key, AliasTable] = {}
+        self._stale: Set[_Key] = set()
+        # {NAME: (BAND, (BAND, ARCANA))} so a demon can be moved without looking through every pool
+        self._where: Dict[str, Tuple[_Key, _Key]] = {}
+        if compendium is not None:
+            for entry in compendium._entries.values():
+                self.add(entry.name, entry.level, entry.arcana)
+
+    def band_for(self, level: int) -> int:
+        return max(0, level - 1) // self.band_size
+
+    @property
+    def bands(self) -> List[int]:
+        return sorted(key for key in self._pools if isinstance(key, int))
+
+    def add(self, name: str, level: int, arcana: Arcana = Arcana.NONE) -> None:
+        """Add a demon (or update its level), only the tables it's in get rebuilt"""
+        self.remove(name)
+        band = self.band_for(level)
+        keys: Tuple[_Key, _Key] = (band, (band, arcana))
+        for key in keys:
+            self._pools.setdefault(key, {})[name] = level
+            self._stale.add(key)
+        self._where[name] = keys
+
+    def remove(self, name: str) -> None:
+        for key in self._where.pop(name, ()):
+            pool = self._pools[key]
+            del pool[name]
+            self._stale.add(key)
+            if not pool:
+                del self._pools[key]
+
+    def _table(self, key: _Key) -> Optional[AliasTable]:
+        if key in self._stale:
+            self._stale.discard(key)
+            self._tables.pop(key, None)
+            pool = self._pools.get(key)
+            if pool:
+                low = min(pool.values())
+                # The lowest level in the band has weight 1, each level above it is less likely
+                self._tables[key] = AliasTable(
+                    list(pool), [1 / (1 + level - low) for level in pool.values()]
+                )
+        return self._tables.get(key)
+
+    def table_for(self, level: int, arcana: Optional[Arcana] = None) -> Optional[AliasTable]:
+        """The table for a level, the closest band with demons in it if that one's empty"""
+        band = self.band_for(level)
+        bands = self.bands
+        if not bands:
+            return None
+        if band not in self._pools:
+            band = min(bands, key=lambda b: (abs(b - band), b))
+        if arcana is not None:
+            return self._table((band, arcana))
+        return self._table(band)
+
+    def party_size(self, level: int) -> int:
+        return min(MAX_PARTY_SIZE, 1 + level // 10)
+
+    def draw(
+        self,
+        level: int,
+        *,
+        size: Optional[int] = None,
+        arcana: Optional[Arcana] = None,
+        rng: Optional[random.Random] = None,
+    ) -> List[str]:
+        """The names of an enemy party for someone at `level`
+
+        Empty if there's nothing to draw (or nothing of that arcana near that level)
+        """
+        table = self.table_for(level, arcana)
+        if table is None:
+            return []
+        return table.draw_many(rng or self.rng, self.party_size(level) if size is None else size)
+
+    def draw_many(
+        self,
+        levels: Sequence[int],
+        *,
+        arcana: Optional[Arcana] = None,
+        rng: Optional[random.Random] = None,
+    ) -> List[List[str]]:
+        """An enemy party for each level, for spawning a bunch of encounters at once"""
+        rng = rng or self.rng
+        # Tables are looked up once per level, not once per party
+        tables = {level: self.table_for(level, arcana) for level in set(levels)}
+        ret: List[List[str]] = []
+        for level in levels:
+            table = tables[level]
+            ret.append([] if table is None else table.draw_many(rng, self.party_size(level)))
+        return ret
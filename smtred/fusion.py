@@ -0,0 +1,297 @@
+"""
+Fusion for the Velvet Room
+
+Fusing two demons works like Persona:
+    - the arcana of the result comes from the fusion table, this cog's own chart rather than
+      any game's: the arcana whose number is the sum of the two (wrapping around),
+      and the same arcana twice gives that arcana back
+    - for two different arcana the result is the weakest demon of that arcana
+      at or above the average level of the two + 1
+    - for two of the same arcana the result is the strongest demon of that arcana
+      below the average level that isn't one of the two being fused
+"""
+
+# Copyright (c) 2025 - Amy (jojo7791)
+# Licensed under MIT
+
+from __future__ import annotations
+
+import bisect
+import heapq
+import threading
+from typing import Dict, Final, FrozenSet, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+from .compendium import Compendium, DemonTemplate
+from .demons import Arcana
+
+__all__: Final[Tuple[str, ...]] = ("FusionEngine", "FusionPath", "fusion_cost")
+
+# How many fusions `fusion_path` is allowed to try before giving up
+SEARCH_BUDGET: Final[int] = 50_000
+# How many `fusion_path` results to remember
+PATH_MEMO_SIZE: Final[int] = 1024
+
+# The major arcana in order, `Arcana.NONE` can't be fused
+_MAJOR_ARCANA: Final[Tuple[Arcana, ...]] = tuple(a for a in Arcana if a is not Arcana.NONE)
+
+
+def _build_table() -> Dict[Tuple[Arcana, Arcana], Arcana]:
+    table: Dict[Tuple[Arcana, Arcana], Arcana] = {}
+    size = len(_MAJOR_ARCANA)
+    for i, first in enumerate(_MAJOR_ARCANA):
+        for j, second in enumerate(_MAJOR_ARCANA):
+            table[(first, second)] = first if i == j else _MAJOR_ARCANA[(i + j) % size]
+    return table
+
+
+FUSION_TABLE: Final[Dict[Tuple[Arcana, Arcana], Arcana]] = _build_table()
+
+
+def fusion_cost(result: DemonTemplate) -> int:
+    """How much Macca Igor charges to fuse a demon"""
+    return result.level * 100
+
+
+class FusionPath(NamedTuple):
+    cost: int
+    # (FIRST, SECOND, RESULT) in the order they need to be fused
+    steps: Tuple[Tuple[str, str, str], ...]
+
+
+class FusionEngine:
+    def __init__(self, compendium: Compendium):
+        self.compendium = compendium
+        # {ARCANA: (DEMONS SORTED BY LEVEL, THEIR LEVELS)}
+        self._arcana: Dict[Arcana, Tuple[Tuple[DemonTemplate, ...], Tuple[int, ...]]] = {}
+        for arcana in _MAJOR_ARCANA:
+            demons = compendium.by_arcana(arcana)
+            self._arcana[arcana] = (demons, tuple(d.level for d in demons))
+        # {(NAME, NAME): RESULT}
+        self._results: Dict[Tuple[str, str], Optional[DemonTemplate]] = {}
+        # {(ROSTER, TARGET, MAX_DEPTH): PATH}
+        self._paths: Dict[Tuple[FrozenSet[str], str, int], Optional[FusionPath]] = {}
+        # Searches run in executor threads, this only covers `_paths` and not the searches
+        self._paths_lock = threading.Lock()
+
+    def invalidate(self) -> None:
+        """Forget everything that's been worked out, for when the compendium changes"""
+        self._results.clear()
+        with self._paths_lock:
+            self._paths.clear()
+
+    def _fuse(self, first: DemonTemplate, second: DemonTemplate) -> Optional[DemonTemplate]:
+        arcana = FUSION_TABLE.get((first.arcana, second.arcana))
+        if arcana is None:
+            return None
+        demons, levels = self._arcana[arcana]
+        level = (first.level + second.level) // 2 + 1
+
+        if first.arcana is not second.arcana:
+            index = bisect.bisect_left(levels, level)
+            if index == len(demons):
+                return None
+            return demons[index]
+
+        # Same arcana goes down, skipping the ingredients
+        index = bisect.bisect_left(levels, level) - 1
+        while index >= 0:
+            demon = demons[index]
+            if demon.name != first.name and demon.name != second.name:
+                return demon
+            index -= 1
+        return None
+
+    def fuse(self, first: DemonTemplate, second: DemonTemplate) -> Optional[DemonTemplate]:
+        """What fusing two demons gives, None if they can't be fused"""
+        if first.name == second.name:
+            return None
+        key = (first.name, second.name) if first.name < second.name else (second.name, first.name)
+        try:
+            return self._results[key]
+        except KeyError:
+            result = self._results[key] = self._fuse(first, second)
+            return result
+
+    def fusions(self, roster: Iterable[str]) -> Dict[str, Tuple[str, str]]:
+        """Everything that can be made from a roster
+
+        Returns {RESULT: (FIRST, SECOND)}, one recipe per result
+
+        The roster is grouped by arcana and level, and each arcana's levels boiled down to a
+        bitmask. For two different arcana the result only depends on the sum of the levels, so
+        shifting one mask by each level of the other gives every sum at once and each demon of
+        the result arcana is a range check on that. Same arcana pairs skip their ingredients so
+        they're still fused pair by pair, but only within one arcana
+        """
+        # {ARCANA: {LEVEL: [DEMON]}}
+        groups: Dict[Arcana, Dict[int, List[DemonTemplate]]] = {}
+        for name in set(roster):
+            template = self.compendium.get(name)
+            if template is None or template.arcana is Arcana.NONE:
+                continue
+            groups.setdefault(template.arcana, {}).setdefault(template.level, []).append(template)
+        # {ARCANA: LEVEL MASK}
+        masks = {arcana: sum(1 << level for level in levels) for arcana, levels in groups.items()}
+
+        ret: Dict[str, Tuple[str, str]] = {}
+        arcanas = sorted(groups, key=_MAJOR_ARCANA.index)
+        for i, first in enumerate(arcanas):
+            self._same_arcana(groups[first], ret)
+            for second in arcanas[i + 1 :]:
+                self._mixed_arcana(groups[first], masks[first], groups[second], ret)
+        return ret
+
+    def _same_arcana(
+        self, levels: Dict[int, List[DemonTemplate]], ret: Dict[str, Tuple[str, str]]
+    ) -> None:
+        # The result skips whichever two went in, so demons on the same level can give different
+        # results and every pair has to be tried
+        demons = [demon for level in sorted(levels) for demon in levels[level]]
+        for i, first in enumerate(demons):
+            for second in demons[i + 1 :]:
+                result = self.fuse(first, second)
+                if result is not None and result.name not in ret:
+                    ret[result.name] = (first.name, second.name)
+
+    def _mixed_arcana(
+        self,
+        first: Dict[int, List[DemonTemplate]],
+        first_mask: int,
+        second: Dict[int, List[DemonTemplate]],
+        ret: Dict[str, Tuple[str, str]],
+    ) -> None:
+        first_arcana = next(iter(first.values()))[0].arcana
+        second_arcana = next(iter(second.values()))[0].arcana
+        arcana = FUSION_TABLE.get((first_arcana, second_arcana))
+        if arcana is None:
+            return
+        # Bit n is set if some pair of levels adds up to n
+        sums = 0
+        for level in second:
+            sums |= first_mask << level
+        demons, levels = self._arcana[arcana]
+
+        # A pair makes the weakest demon at or above (sum // 2 + 1), so demon i comes from
+        # the sums where that lands between the level before it (exclusive) and its own
+        previous = None
+        for demon, level in zip(demons, levels):
+            if level == previous:
+                # Same level as the one before, that one always wins
+                continue
+            low = 0 if previous is None else 2 * previous
+            high = 2 * level - 1
+            previous = level
+            if low > high or demon.name in ret:
+                continue
+            hits = (sums >> low) & ((1 << (high - low + 1)) - 1)
+            if not hits:
+                continue
+            total = low + (hits & -hits).bit_length() - 1
+            for first_level, first_group in first.items():
+                second_group = second.get(total - first_level)
+                if second_group:
+                    ret[demon.name] = (first_group[0].name, second_group[0].name)
+                    break
+
+    def fusion_path(
+        self,
+        roster: Iterable[str],
+        target: str,
+        *,
+        max_depth: int = 3,
+        budget: int = SEARCH_BUDGET,
+    ) -> Optional[FusionPath]:
+        """The cheapest way to fuse `target` out of a roster, None if there isn't one
+
+        Searches up to `max_depth` fusions deep, cheapest first, and gives up after `budget`
+        fusions have been tried. Demons in the roster are free, but fusing uses up both
+        ingredients so each one (and each demon made along the way) goes into one fusion at most.
+        Every demon keeps only its cheapest recipe, so a pricier one that would have avoided
+        reusing a demon isn't looked for. Results are remembered until `invalidate` gets called
+        """
+        target_template = self.compendium.get(target)
+        if target_template is None:
+            return None
+        owned = frozenset(
+            template.name for template in map(self.compendium.get, roster) if template is not None
+        )
+        key = (owned, target_template.name, max_depth)
+        with self._paths_lock:
+            if key in self._paths:
+                return self._paths[key]
+        path = self._search(owned, target_template, max_depth, budget)
+        with self._paths_lock:
+            if len(self._paths) >= PATH_MEMO_SIZE:
+                # Oldest goes first
+                self._paths.pop(next(iter(self._paths), None), None)
+            self._paths[key] = path
+        return path
+
+    def _search(
+        self, owned: FrozenSet[str], target: DemonTemplate, max_depth: int, budget: int
+    ) -> Optional[FusionPath]:
+        if target.name in owned:
+            return FusionPath(0, ())
+
+        # {NAME: (COST, DEPTH, ROSTER DEMONS IT USES UP, RECIPE)}
+        best: Dict[str, Tuple[int, int, FrozenSet[str], Optional[Tuple[str, str]]]] = {
+            name: (0, 0, frozenset((name,)), None) for name in owned
+        }
+        heap: List[Tuple[int, int, str]] = [(0, 0, name) for name in sorted(owned)]
+        settled: List[Tuple[DemonTemplate, int, int, FrozenSet[str]]] = []
+        done: Set[str] = set()
+        while heap:
+            cost, depth, name = heapq.heappop(heap)
+            if name in done:
+                continue
+            if name == target.name:
+                return FusionPath(cost, tuple(self._steps(best, name)))
+            done.add(name)
+            template = self.compendium[name]
+            used = best[name][2]
+            settled.append((template, cost, depth, used))
+            if depth >= max_depth:
+                continue
+
+            for other, other_cost, other_depth, other_used in settled:
+                budget -= 1
+                if budget < 0:
+                    return None
+                if used & other_used:
+                    # Both sides need the same roster demon, it can only be fused away once
+                    continue
+                result = self.fuse(template, other)
+                if result is None or result.name in done:
+                    continue
+                new_depth = max(depth, other_depth) + 1
+                if new_depth > max_depth:
+                    continue
+                new_cost = cost + other_cost + fusion_cost(result)
+                if new_cost < best.get(result.name, (new_cost + 1,))[0]:
+                    best[result.name] = (
+                        new_cost,
+                        new_depth,
+                        used | other_used,
+                        (name, other.name),
+                    )
+                    heapq.heappush(heap, (new_cost, new_depth, result.name))
+        return None
+
+    @staticmethod
+    def _steps(
+        best: Dict[str, Tuple[int, int, FrozenSet[str], Optional[Tuple[str, str]]]], name: str
+    ) -> List[Tuple[str, str, str]]:
+        # Ingredients never share a roster demon, so every fusion in the tree is its own step
+        steps: List[Tuple[str, str, str]] = []
+        stack: List[Tuple[str, bool]] = [(name, False)]
+        while stack:
+            current, expanded = stack.pop()
+            recipe = best[current][3]
+            if recipe is None:
+                continue
+            if expanded:
+                steps.append((recipe[0], recipe[1], current))
+                continue
+            stack.append((current, True))
+            stack.extend((ingredient, False) for ingredient in recipe)
+        return steps
@@ -0,0 +1,83 @@
+# Copyright (c) 2025 - Amy (jojo7791)
+# Licensed under MIT
+
+from __future__ import annotations
+
+import bisect
+from typing import Dict, Final, List, Optional, Tuple
+
+__all__: Final[Tuple[str, ...]] = ("Leaderboard",)
+
+
+try:
+    from sortedcontainers import SortedList
+
+    # NOTE sortedcontainers isn't a requirement, it makes updates O(log n) if it's around
+
+except ModuleNotFoundError:
+
+    class SortedList:  # type:ignore
+        """The bits of `sortedcontainers.SortedList` the leaderboard needs"""
+
+        def __init__(self):
+            self._items: List[Tuple[int, int]] = []
+
+        def __len__(self) -> int:
+            return len(self._items)
+
+        def __getitem__(self, index):
+            return self._items[index]
+
+        def add(self, item: Tuple[int, int]) -> None:
+            bisect.insort(self._items, item)
+
+        def remove(self, item: Tuple[int, int]) -> None:
+            del self._items[bisect.bisect_left(self._items, item)]
+
+        def bisect_left(self, item: Tuple[int, int]) -> int:
+            return bisect.bisect_left(self._items, item)
+
+
+class Leaderboard:
+    """Everyone's Macca in order, kept up to date by the bank instead of sorted every time"""
+
+    def __init__(self):
+        # (-MACCA, USER_ID) so the richest come first and ties go to the oldest account
+        self._entries = SortedList()
+        # {USER_ID: MACCA}
+        self._balances: Dict[int, int] = {}
+        self.seeded = False
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def update(self, user_id: int, macca: int) -> None:
+        old = self._balances.get(user_id)
+        if old == macca:
+            return
+        if old is not None:
+            self._entries.remove((-old, user_id))
+        self._balances[user_id] = macca
+        self._entries.add((-macca, user_id))
+
+    def seed(self, bank: Dict[str, dict], *, skip: Optional[Dict[int, int]] = None) -> None:
+        """Fill the leaderboard from `Config.custom("MACCA_BANK").all()`
+
+        Anyone in `skip` is left alone, for balances that are newer than what's in Config
+        """
+        for user_id, data in bank.items():
+            if skip and int(user_id) in skip:
+                continue
+            self.update(int(user_id), data.get("macca", 0))
+        self.seeded = True
+
+    def rank(self, user_id: int) -> Optional[int]:
+        """A user's place on the leaderboard, starting at 1"""
+        macca = self._balances.get(user_id)
+        if macca is None:
+            return None
+        return self._entries.bisect_left((-macca, user_id)) + 1
+
+    def top(self, amount: int, offset: int = 0) -> List[Tuple[int, int]]:
+        """[(USER_ID, MACCA)] for the richest `amount` users after skipping `offset`"""
+        return [(user_id, -macca) for macca, user_id in self._entries[offset : offset + amount]]
@@ -3,13 +3,29 @@
 
 from __future__ import annotations
 
-from typing import TYPE_CHECKING, Dict, Final, Tuple
+import asyncio
+import contextlib
+import logging
+import time
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, AsyncIterator, Dict, Final, Iterable, Optional, Tuple
 
 from redbot.core import Config
 
 from ._types import UserMemberOrInt
+from .leaderboard import Leaderboard
+from .utils import CacheStats, LRUCache
 
-__all__: Final[Tuple[str, ...]] = ("MaccaBank",)
+__all__: Final[Tuple[str, ...]] = ("FlushStats", "InsufficientMacca", "MaccaBank")
+
+log = logging.getLogger("red.jojocogs.smtred.macca")
+
+# Flush as soon as this many users have unsaved balances
+FLUSH_THRESHOLD: Final[int] = 100
+# How many balances to keep in memory
+CACHE_SIZE: Final[int] = 10_000
+# Users share this many locks so memory doesn't grow with the amount of users
+LOCK_STRIPES: Final[int] = 64
 
 
 def _get_user_id(maybe_user: UserMemberOrInt) -> int:
@@ -18,51 +34,324 @@ def _get_user_id(maybe_user: UserMemberOrInt) -> int:
     return maybe_user.id
 
 
+class InsufficientMacca(ValueError):
+    """Gets raised when someone doesn't have enough Macca for something"""
+
+    def __init__(self, user_id: int, needed: int):
+        super().__init__(f"User {user_id} doesn't have ћ{needed}")
+        self.user_id = user_id
+        self.needed = needed
+
+
 class Macca(int):
     """int subclass that just adds `ћ` to the start of the str version"""
 
     def __str__(self) -> str:
-        return f"ћ{super().__str__()}"
+        # int's __str__ goes through __repr__, which would add a second ћ
+        return f"ћ{int.__repr__(self)}"
 
     def __repr__(self) -> str:
-        return f"ћ{super().__repr__()}"
+        return f"ћ{int.__repr__(self)}"
+
+
+@dataclass
+class FlushStats:
+    flushes: int = 0
+    written: int = 0
+    largest_batch: int = 0
+    last_batch: int = 0
+    last_latency: float = 0.0
+    total_latency: float = 0.0
+    failures: int = 0
+
+    @property
+    def average_batch(self) -> float:
+        return self.written / self.flushes if self.flushes else 0.0
+
+    @property
+    def average_latency(self) -> float:
+        return self.total_latency / self.flushes if self.flushes else 0.0
+
+    def __str__(self) -> str:
+        return (
+            f"Flushes: {self.flushes} ({self.failures} failed)\n"
+            f"Batch size: last {self.last_batch}, average {self.average_batch:.1f}, "
+            f"largest {self.largest_batch}\n"
+            f"Latency: last {self.last_latency * 1000:.2f}ms, "
+            f"average {self.average_latency * 1000:.2f}ms"
+        )
 
 
 class MaccaBank:
-    def __init__(self, config: Config):
+    """Where everyone's Macca lives
+
+    By default every change is written to Config straight away.
+    With a `flush_interval` the bank becomes write-behind: balances change in memory right away
+    and the changes get written in one go every `flush_interval` seconds
+    (or once `flush_threshold` users have changed). That means a crash can lose up to
+    `flush_interval` seconds of changes, so keep it low if that matters.
+    """
+
+    def __init__(
+        self,
+        config: Config,
+        *,
+        flush_interval: float = 0.0,
+        flush_threshold: int = FLUSH_THRESHOLD,
+        cache_size: int = CACHE_SIZE,
+        cache_ttl: Optional[float] = None,
+    ):
         self._config = config
+        self.flush_interval = flush_interval
+        self.flush_threshold = flush_threshold
+        self.flush_stats = FlushStats()
 
         # {USER_ID: MACCA}
-        self.__cache: Dict[int, int] = {}
+        self.__cache: LRUCache[int, int] = LRUCache(cache_size, ttl=cache_ttl)
+        # {USER_ID: MACCA} balances that haven't been written yet
+        # These never get evicted, they're always the newest balance
+        self._dirty: Dict[int, int] = {}
+        self._flush_lock = asyncio.Lock()
+        self._locks: Tuple[asyncio.Lock, ...] = tuple(asyncio.Lock() for _ in range(LOCK_STRIPES))
+        self._flush_task: Optional[asyncio.Task] = None
+        self._threshold_task: Optional[asyncio.Task] = None
+        self.leaderboard = Leaderboard()
 
-    async def get_user_amount(self, user: UserMemberOrInt) -> Macca:
-        user_id = _get_user_id(user)
-        maybe_cached = self.__cache.get(user_id)
-        if maybe_cached:
-            return Macca(maybe_cached)
-        del maybe_cached
+    @property
+    def write_behind(self) -> bool:
+        return self.flush_interval > 0
+
+    def start(self) -> None:
+        """Start flushing in the background, only needed for write-behind"""
+        if self.write_behind and self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_loop())
+
+    async def close(self) -> None:
+        """Stop flushing in the background and write everything that's left"""
+        for task in (self._flush_task, self._threshold_task):
+            if task is not None:
+                task.cancel()
+                with contextlib.suppress(asyncio.CancelledError):
+                    await task
+        self._flush_task = self._threshold_task = None
+        await self.flush()
+
+    async def set_flush_interval(self, flush_interval: float) -> None:
+        """Switch between write-through (0) and write-behind"""
+        await self.close()
+        self.flush_interval = flush_interval
+        self.start()
+
+    async def _safe_flush(self) -> None:
+        try:
+            await self.flush()
+        except Exception as e:
+            log.error("Couldn't flush the macca bank", exc_info=e)
+
+    async def _flush_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self._safe_flush()
+
+    async def flush(self) -> None:
+        """Write every unsaved balance to Config in one go
+
+        Only the users that changed get written, all at the same time
+        """
+        async with self._flush_lock:
+            if not self._dirty:
+                return
+            batch, self._dirty = self._dirty, {}
+            group = self._config.custom("MACCA_BANK")
+            start = time.perf_counter()
+            try:
+                results = await asyncio.gather(
+                    *(
+                        group.set_raw(str(user_id), "macca", value=macca)
+                        for user_id, macca in batch.items()
+                    ),
+                    return_exceptions=True,
+                )
+            except BaseException:
+                # Cancelled partway, put them all back. Anything newer wins
+                self.flush_stats.failures += 1
+                self._dirty = {**batch, **self._dirty}
+                raise
+            failed = {
+                user_id: macca
+                for (user_id, macca), result in zip(batch.items(), results)
+                if isinstance(result, BaseException)
+            }
+            if failed:
+                # Only the ones that didn't make it get tried again (or flushed on unload)
+                self.flush_stats.failures += 1
+                self._dirty = {**failed, **self._dirty}
+                raise next(r for r in results if isinstance(r, BaseException))
+            latency = time.perf_counter() - start
+
+            stats = self.flush_stats
+            stats.flushes += 1
+            stats.written += len(batch)
+            stats.last_batch = len(batch)
+            stats.largest_batch = max(stats.largest_batch, len(batch))
+            stats.last_latency = latency
+            stats.total_latency += latency
+
+    async def load(self, *, warm: bool = False) -> int:
+        """Read the whole bank once to seed the leaderboard
+
+        With `warm` the balances also go into the cache, up to its capacity,
+        anyone past that is read when they're needed. Returns how many got cached
+        """
+        bank = await self._config.custom("MACCA_BANK").all()
+        # Anything set since the cog loaded is newer than what's in Config
+        self.leaderboard.seed(bank, skip=self._dirty)
+        if not warm:
+            return 0
+        loaded = 0
+        for user_id, data in bank.items():
+            if loaded >= self.__cache.capacity:
+                break
+            if int(user_id) not in self.__cache:
+                self.__cache.set(int(user_id), data.get("macca", 0))
+            loaded += 1
+        return loaded
+
+    @property
+    def cache_stats(self) -> CacheStats:
+        return self.__cache.stats
+
+    def _cached(self, user_id: int) -> Optional[int]:
+        maybe_cached = self._dirty.get(user_id)
+        if maybe_cached is None:
+            maybe_cached = self.__cache.get(user_id)
+        return maybe_cached
+
+    async def _read(self, user_id: int) -> int:
+        # The user's lock has to be held for this, otherwise a write could land while Config is
+        # being read and the older balance would go into the cache over it
+        maybe_cached = self._cached(user_id)
+        if maybe_cached is not None:
+            return maybe_cached
 
         macca = await self._config.custom("MACCA_BANK", str(user_id)).macca()
         if TYPE_CHECKING:
             assert isinstance(macca, int)
 
-        self.__cache[user_id] = macca
-        return Macca(macca)
+        self.__cache.set(user_id, macca)
+        return macca
+
+    async def get_user_amount(self, user: UserMemberOrInt) -> Macca:
+        user_id = _get_user_id(user)
+        maybe_cached = self._cached(user_id)
+        if maybe_cached is not None:
+            return Macca(maybe_cached)
+        async with self._locked(user_id):
+            return Macca(await self._read(user_id))
+
+    @contextlib.asynccontextmanager
+    async def _locked(self, *user_ids: int) -> AsyncIterator[None]:
+        # Always taken in the same order so two transfers can't deadlock each other
+        stripes = sorted({user_id % LOCK_STRIPES for user_id in user_ids})
+        async with contextlib.AsyncExitStack() as stack:
+            for stripe in stripes:
+                await stack.enter_async_context(self._locks[stripe])
+            yield
+
+    async def _write(self, balances: Dict[int, int], previous: Dict[int, int]) -> None:
+        # Write-through, if a write fails the ones before it get their `previous` balance back
+        group = self._config.custom("MACCA_BANK")
+        written = []
+        try:
+            for user_id, macca in balances.items():
+                await group.set_raw(str(user_id), "macca", value=macca)
+                written.append(user_id)
+        except BaseException:
+            for user_id in written:
+                try:
+                    await group.set_raw(str(user_id), "macca", value=previous[user_id])
+                except Exception as e:
+                    log.error("Couldn't roll back the balance of %d", user_id, exc_info=e)
+            raise
+
+    async def _set(
+        self, balances: Dict[int, int], previous: Optional[Dict[int, int]] = None
+    ) -> None:
+        # Every user's lock has to be held for this
+        # `previous` is only needed to roll back when more than one user gets written
+        balances = {user_id: max(0, macca) for user_id, macca in balances.items()}
+        if not self.write_behind:
+            # Config first, memory only changes once it's saved
+            await self._write(balances, previous or {})
+        for user_id, macca in balances.items():
+            self.__cache.set(user_id, macca)
+            self.leaderboard.update(user_id, macca)
+        if not self.write_behind:
+            return
+        self._dirty.update(balances)
+        if len(self._dirty) >= self.flush_threshold and (
+            self._threshold_task is None or self._threshold_task.done()
+        ):
+            self._threshold_task = asyncio.create_task(self._safe_flush())
 
     async def add_to_user(self, user: UserMemberOrInt, amount: int) -> None:
         if amount < 0:
             raise ValueError("Cannot go below 0 Macca")
         user_id = _get_user_id(user)
-        current_amount = await self.get_user_amount(user_id)
-        macca = current_amount + amount
-        await self.set_user_amount(user_id, macca)
+        async with self._locked(user_id):
+            current_amount = await self._read(user_id)
+            await self._set({user_id: current_amount + amount})
 
     async def set_user_amount(self, user: UserMemberOrInt, amount: int) -> None:
+        user_id = _get_user_id(user)
+        async with self._locked(user_id):
+            await self._set({user_id: amount})
+
+    async def try_spend(self, user: UserMemberOrInt, amount: int) -> bool:
+        """Take Macca from a user if they have enough, returns whether they did"""
         if amount < 0:
-            amount = 0
+            raise ValueError("Cannot pay < 0 macca")
         user_id = _get_user_id(user)
-        await self._config.custom("MACCA_BANK", str(user_id)).macca.set(amount)
-        self.__cache[user_id] = amount
+        async with self._locked(user_id):
+            current_amount = await self._read(user_id)
+            if current_amount < amount:
+                return False
+            await self._set({user_id: current_amount - amount})
+            return True
+
+    async def transfer(
+        self, from_user: UserMemberOrInt, to_user: UserMemberOrInt, amount: int
+    ) -> None:
+        """Move Macca from one user to another
+
+        Raises `InsufficientMacca` if `from_user` can't afford it, nothing changes if it does
+        """
+        if amount < 0:
+            raise ValueError("Cannot transfer < 0 macca")
+        await self.apply([(from_user, -amount), (to_user, amount)])
+
+    async def apply(self, changes: Iterable[Tuple[UserMemberOrInt, int]]) -> Dict[int, Macca]:
+        """Add (or take away, with a negative number) Macca for a bunch of users at once
+
+        Either every change happens or none of them do, if anyone would end up below 0
+        `InsufficientMacca` gets raised. When writing straight to Config a failed write
+        puts back the balances that were already written. Returns everyone's new balance
+        """
+        deltas: Dict[int, int] = {}
+        for user, amount in changes:
+            user_id = _get_user_id(user)
+            deltas[user_id] = deltas.get(user_id, 0) + amount
+
+        async with self._locked(*deltas):
+            previous: Dict[int, int] = {}
+            balances: Dict[int, int] = {}
+            for user_id, delta in deltas.items():
+                previous[user_id] = await self._read(user_id)
+                balances[user_id] = previous[user_id] + delta
+                if balances[user_id] < 0:
+                    raise InsufficientMacca(user_id, -delta)
+            await self._set(balances, previous)
+        return {user_id: Macca(macca) for user_id, macca in balances.items()}
 
     async def can_pay(self, user: UserMemberOrInt, amount: int) -> bool:
         if amount < 0:
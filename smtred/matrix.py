@@ -0,0 +1,183 @@
+"""
+Damage multipliers for demons against every element
+
+Rows are resistance vectors and columns are `ELEMENTS`. Demons with the same resistances share
+a row, so a demon that isn't in the compendium (or has had its resistances changed) just gets
+a row of its own the first time it's looked up. Resolving an element against a whole party
+is one lookup for the party instead of going through each demon.
+
+To compare it to going through each demon run `python -m smtred.matrix path/to/demons.json`
+"""
+
+# Copyright (c) 2025 - Amy (jojo7791)
+# Licensed under MIT
+
+from __future__ import annotations
+
+import sys
+import threading
+import time
+from typing import TYPE_CHECKING, Dict, Final, Iterable, List, Optional, Sequence, Tuple, Union
+
+from .demons import _ELEMENT_INDEX, ELEMENTS, Demon, ResistEnum
+
+if TYPE_CHECKING:
+    from .compendium import Compendium
+
+__all__: Final[Tuple[str, ...]] = ("ResistanceMatrix", "resisted_damage")
+
+
+try:
+    import numpy
+
+    # NOTE numpy isn't a requirement, if it's there this gets to use it
+    # otherwise it's the same thing with lists
+    HAS_NUMPY: bool = True
+
+except ModuleNotFoundError:
+    HAS_NUMPY = False
+
+_MULTIPLIERS: Final[Dict[ResistEnum, float]] = {
+    ResistEnum.NONE: 1.0,
+    ResistEnum.WEAK: 1.5,
+    ResistEnum.STRONG: 0.5,
+    ResistEnum.NULL: 0.0,
+    ResistEnum.ABSORB: -1.0,
+}
+
+# numpy only pays for its overhead from around this many demons, battle sized parties use lists
+NUMPY_MIN_ROWS: Final[int] = 16
+
+_Resistances = Tuple[ResistEnum, ...]
+
+
+def resisted_damage(base: float, resist: ResistEnum) -> int:
+    """Damage after a resistance, 0 if it's nulled and negative (the HP healed) if it's absorbed
+
+    Anything that isn't nulled does at least 1
+    """
+    if resist is ResistEnum.NULL:
+        return 0
+    damage = max(1, int(base * abs(_MULTIPLIERS[resist])))
+    return -damage if resist is ResistEnum.ABSORB else damage
+
+
+class ResistanceMatrix:
+    """Damage multipliers for every resistance vector against every element
+
+    Built from the compendium up front, anything else gets added when it's first seen
+    """
+
+    def __init__(self, compendium: Optional[Compendium] = None):
+        # {RESISTANCES: ROW}
+        self._rows: Dict[_Resistances, int] = {}
+        self._resists: List[_Resistances] = []
+        # Rebuilt the next time it's needed after a row gets added
+        self._matrix = None
+        # Battles get played back in executor threads, this covers adding rows and rebuilding
+        self._lock = threading.Lock()
+        if compendium is not None:
+            for entry in compendium._entries.values():
+                self._row(entry.resistances)
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def _row(self, resistances: _Resistances) -> int:
+        row = self._rows.get(resistances)
+        if row is not None:
+            return row
+        with self._lock:
+            row = self._rows.get(resistances)
+            if row is None:
+                self._resists.append(resistances)
+                row = self._rows[resistances] = len(self._resists) - 1
+                self._matrix = None
+            return row
+
+    def _array(self):
+        with self._lock:
+            if self._matrix is None:
+                # float64 so numbers come out the same as `resisted_damage`
+                self._matrix = numpy.array(
+                    [[_MULTIPLIERS[resist] for resist in row] for row in self._resists],
+                    dtype=numpy.float64,
+                ).reshape(-1, len(ELEMENTS))
+            return self._matrix
+
+    def rows_for(self, demons: Iterable[Demon]) -> List[int]:
+        """The rows for a group of demons, these can be kept around for repeated lookups"""
+        return [self._row(demon._resistances) for demon in demons]
+
+    def resists(self, element: str, rows: Sequence[int]) -> List[ResistEnum]:
+        column = _ELEMENT_INDEX[element]
+        return [self._resists[row][column] for row in rows]
+
+    def multipliers(self, element: str, rows: Sequence[int]) -> Sequence[float]:
+        """The multiplier for each row against `element`
+
+        Negative means the damage is absorbed, 0 means it's nulled
+        """
+        column = _ELEMENT_INDEX[element]
+        if HAS_NUMPY and len(rows) >= NUMPY_MIN_ROWS:
+            return self._array()[rows, column]
+        return [_MULTIPLIERS[self._resists[row][column]] for row in rows]
+
+    def damage(
+        self, element: str, rows: Sequence[int], base: Union[float, Sequence[float]]
+    ) -> List[int]:
+        """Damage dealt to every row, by the same rules as `resisted_damage`
+
+        `base` can be one number for everyone or one per row (e.g. after each target's defense)
+        """
+        if not rows:
+            return []
+        if HAS_NUMPY and len(rows) >= NUMPY_MIN_ROWS:
+            multipliers = self.multipliers(element, rows)
+            damage = numpy.maximum(
+                1,
+                (numpy.asarray(base, dtype=numpy.float64) * numpy.abs(multipliers)).astype(
+                    numpy.int64
+                ),
+            )
+            damage = numpy.where(multipliers < 0, -damage, damage)
+            return numpy.where(multipliers == 0, 0, damage).tolist()
+        column = _ELEMENT_INDEX[element]
+        bases = [base] * len(rows) if isinstance(base, (int, float)) else base
+        return [resisted_damage(b, self._resists[row][column]) for b, row in zip(bases, rows)]
+
+    def party_damage(
+        self, element: str, demons: Iterable[Demon], base: Union[float, Sequence[float]]
+    ) -> List[int]:
+        return self.damage(element, self.rows_for(demons), base)
+
+
+def _benchmark(path: str) -> None:
+    from .cache import load_compendium
+
+    compendium = load_compendium(path)
+    matrix = ResistanceMatrix(compendium)
+    templates = list(compendium)
+    for size in (3, 16, 64):
+        party = [templates[i % len(templates)].to_demon() for i in range(size)]
+        rows = matrix.rows_for(party)
+        bases = [100.0 + i for i in range(size)]
+        runs = 20_000
+
+        start = time.perf_counter()
+        for _ in range(runs):
+            [resisted_damage(b, demon.resistance("ice")) for b, demon in zip(bases, party)]
+        per_demon = (time.perf_counter() - start) / runs
+
+        start = time.perf_counter()
+        for _ in range(runs):
+            matrix.damage("ice", rows, bases)
+        batched = (time.perf_counter() - start) / runs
+        print(
+            f"{size} demons: per demon {per_demon * 1e6:.1f}us, "
+            f"matrix {batched * 1e6:.1f}us (numpy: {HAS_NUMPY})"
+        )
+
+
+if __name__ == "__main__":
+    _benchmark(sys.argv[1])
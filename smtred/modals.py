@@ -3,10 +3,25 @@
 
 from __future__ import annotations
 
+import asyncio
 import contextlib
 import datetime
 import logging
-from typing import TYPE_CHECKING, Dict, Final, List, Optional, Tuple, Union, overload
+import time
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Dict,
+    Final,
+    List,
+    Optional,
+    Tuple,
+    Union,
+    overload,
+)
 
 import discord
 from discord.ui.button import button as button_dec
@@ -14,11 +29,23 @@ from redbot.core import commands
 
 from ._types import Self
 from .constants import CONTRACT
+from .utils import LRUCache
 
-__all__: Final[tuple] = ("RegisterView", "Menu", "Page")
+__all__: Final[tuple] = (
+    "RegisterView",
+    "Menu",
+    "Page",
+    "PageSource",
+    "IndexedSource",
+    "StreamSource",
+)
 
 
 log = logging.getLogger("red.smtred.modals")
+# How many pages a source keeps around after loading them
+PAGE_CACHE_SIZE: Final[int] = 8
+# A menu edits its message at most once every this many seconds, presses in between get squashed
+EDIT_INTERVAL: Final[float] = 1.0
 button_emojis: Final[Dict[Tuple[bool, bool], str]] = {
     (False, True): "\N{BLACK LEFT-POINTING DOUBLE TRIANGLE}",
     (False, False): "\N{BLACK LEFT-POINTING TRIANGLE}\N{VARIATION SELECTOR-16}",
@@ -39,10 +66,13 @@ class BaseButton(discord.ui.Button):
         self.skip = skip
 
     async def callback(self, inter: discord.Interaction) -> None:
+        # Answered straight away, the edit itself might be held back for a bit
+        await self.view.acknowledge(inter)
         if self.skip:
             page_num = 1 if self.forward else -1
         else:
-            current_num = self.view.current_page
+            # Counted from the page that's about to be shown so rapid presses add up
+            current_num = self.view.target_page
             page_num = current_num + 1 if self.forward else current_num - 1
         await self.view.show_checked_page(page_num)
 
@@ -59,6 +89,7 @@ class StopButton(discord.ui.Button):
         )
 
     async def callback(self, inter: discord.Interaction) -> None:
+        await self.view.acknowledge(inter)
         self.view.stop()
         with contextlib.suppress(discord.Forbidden):
             await self.view.msg.delete()
@@ -80,25 +111,62 @@ def _gen_timestamp(string: bool = False) -> Union[str, datetime.datetime]:
     return f"<t:{ret}:r>"
 
 
-class Page:
+class PageSource:
+    """Where `Menu` gets its pages from
+
+    On its own a source has no pages, the ones below fill in `page_count` and `_load`
+    (which gets a page by its index and raises `IndexError` past the end).
+    Pages are loaded when they're shown and the last few are kept around
+    """
+
     def __init__(
         self,
         ctx: commands.Context,
-        data: List[str],
         *,
         title: Optional[str] = None,
         footer: Optional[str] = None,
+        cache_size: int = PAGE_CACHE_SIZE,
     ):
         self.ctx = ctx
-        self.data = data
         self.title = title
         self.footer = footer  # Feet
+        self._pages: LRUCache[int, str] = LRUCache(cache_size)
+        # (EMBED_REQUESTED, COLOUR) looked up on the first page
+        self._embed_settings: Optional[Tuple[bool, discord.Colour]] = None
+
+    @property
+    def page_count(self) -> Optional[int]:
+        """How many pages there are, None if that isn't known yet"""
+        return 0
+
+    async def resolve_count(self) -> int:
+        """How many pages there are, working it out if it has to"""
+        return self.page_count or 0
+
+    async def _load(self, index: int) -> str:
+        # Every index is past the end of no pages
+        raise IndexError(index)
+
+    async def get_page(self, index: int) -> str:
+        if index < 0:
+            raise IndexError(index)
+        page = self._pages.get(index)
+        if page is None:
+            page = await self._load(index)
+            self._pages.set(index, page)
+        return page
 
     async def format_page(self, item: str) -> Dict[str, Union[discord.Embed, str]]:
-        if await self.ctx.embed_requested():
+        if self._embed_settings is None:
+            embed_requested = await self.ctx.embed_requested()
+            colour = await self.ctx.embed_colour() if embed_requested else discord.Colour.default()
+            self._embed_settings = (embed_requested, colour)
+        embed_requested, colour = self._embed_settings
+        if embed_requested:
             embed = discord.Embed(
-                colour=await self.ctx.embed_colour(),
+                colour=colour,
                 title=self.title,
+                description=item,
                 timestamp=_gen_timestamp(),
             )
             embed.set_footer(text=self.footer)
@@ -114,6 +182,28 @@ class Page:
         ret += f"\n{footer}"
         return {"content": ret}
 
+
+class Page(PageSource):
+    """Pages that are already made"""
+
+    def __init__(
+        self,
+        ctx: commands.Context,
+        data: List[str],
+        *,
+        title: Optional[str] = None,
+        footer: Optional[str] = None,
+    ):
+        super().__init__(ctx, title=title, footer=footer)
+        self.data = data
+
+    @property
+    def page_count(self) -> int:
+        return len(self.data)
+
+    async def _load(self, index: int) -> str:
+        return self.data[index]
+
     @property
     def __len__(self):
         return self.data.__len__
@@ -123,50 +213,225 @@ class Page:
         pass
 
 
+class IndexedSource(PageSource):
+    """Pages that can be made one at a time by their index, e.g. a slice of the leaderboard"""
+
+    def __init__(
+        self,
+        ctx: commands.Context,
+        count: int,
+        loader: Callable[[int], Awaitable[str]],
+        *,
+        title: Optional[str] = None,
+        footer: Optional[str] = None,
+        cache_size: int = PAGE_CACHE_SIZE,
+    ):
+        super().__init__(ctx, title=title, footer=footer, cache_size=cache_size)
+        self.count = count
+        self._loader = loader
+
+    @property
+    def page_count(self) -> int:
+        return self.count
+
+    async def _load(self, index: int) -> str:
+        if index >= self.count:
+            raise IndexError(index)
+        return await self._loader(index)
+
+
+class StreamSource(PageSource):
+    """Pages from an async generator, only pulled as far as someone pages
+
+    `factory` makes a new generator, it gets called again if someone goes back
+    to a page that's no longer kept around. If `count` isn't given it's worked out
+    once the generator runs out. Only one thing pulls from the generator at a time
+    """
+
+    def __init__(
+        self,
+        ctx: commands.Context,
+        factory: Callable[[], AsyncIterator[str]],
+        *,
+        count: Optional[int] = None,
+        title: Optional[str] = None,
+        footer: Optional[str] = None,
+        cache_size: int = PAGE_CACHE_SIZE,
+    ):
+        super().__init__(ctx, title=title, footer=footer, cache_size=cache_size)
+        self._factory = factory
+        self._count = count
+        self._iter: Optional[AsyncIterator[str]] = None
+        self._next_index = 0
+        # A menu can be loading a page while a button press wants the count
+        self._pull_lock = asyncio.Lock()
+
+    @property
+    def page_count(self) -> Optional[int]:
+        return self._count
+
+    async def _pull(self) -> Optional[str]:
+        if self._iter is None:
+            self._iter = self._factory()
+            self._next_index = 0
+        try:
+            page = await self._iter.__anext__()
+        except StopAsyncIteration:
+            self._count = self._next_index
+            return None
+        self._pages.set(self._next_index, page)
+        self._next_index += 1
+        return page
+
+    async def _load(self, index: int) -> str:
+        async with self._pull_lock:
+            # It might've been pulled while waiting on the lock
+            page = self._pages.get(index)
+            if page is not None:
+                return page
+            if self._count is not None and index >= self._count:
+                raise IndexError(index)
+            if index < self._next_index:
+                # Went back further than what's kept around, start over
+                self._iter = None
+            while True:
+                page = await self._pull()
+                if page is None:
+                    raise IndexError(index)
+                if self._next_index > index:
+                    return page
+
+    async def resolve_count(self) -> int:
+        async with self._pull_lock:
+            while self._count is None:
+                await self._pull()
+            return self._count
+
+
 class Menu(discord.ui.View):
+    """Pages through a `PageSource` with buttons
+
+    `clock` and `sleep` are what edits get spaced out with, they can be swapped for fakes in tests
+    """
+
     if TYPE_CHECKING:
         msg: discord.Message
 
-    def __init__(self, ctx: commands.Context, source: Page, *, timeout: float = 100.0):
+    def __init__(
+        self,
+        ctx: commands.Context,
+        source: PageSource,
+        *,
+        timeout: float = 100.0,
+        edit_interval: float = EDIT_INTERVAL,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], Awaitable[Any]] = asyncio.sleep,
+    ):
         self.ctx = ctx
         self.source = source
         self.current_page: int = 0
+        self.edit_interval = edit_interval
+        self._clock = clock
+        self._sleep = sleep
+        # The page the next edit will show, None if there's nothing waiting
+        self._pending: Optional[int] = None
+        self._edit_task: Optional[asyncio.Task] = None
+        self._last_edit = 0.0
         super().__init__(timeout=timeout)
 
+    @property
+    def target_page(self) -> int:
+        """The page that's showing, or the one that's about to be"""
+        return self.current_page if self._pending is None else self._pending
+
+    @staticmethod
+    async def acknowledge(inter: discord.Interaction) -> None:
+        if not inter.response.is_done():
+            with contextlib.suppress(discord.HTTPException):
+                await inter.response.defer()
+
+    def stop(self) -> None:
+        if self._edit_task is not None:
+            self._edit_task.cancel()
+        self._pending = None
+        super().stop()
+
     def _add_buttons(self) -> None:
-        if len(self.source) > 3:
+        # Sources that don't know how long they are yet are probably long
+        count = self.source.page_count
+        skips = count is None or count > 3
+        if skips:
             self.add_item(BaseButton(False, True))
         self.add_item(BaseButton(False, False))
         self.add_item(StopButton())
         self.add_item(BaseButton(True, False))
-        if len(self.source) > 3:
+        if skips:
             self.add_item(BaseButton(True, True))
 
     @classmethod
-    async def start(cls, ctx: commands.Context, source: Page, *, timeout: float = 100.0) -> Self:
-        self = cls(ctx, source, timeout=timeout)
-        page = self.source.data[0]
+    async def start(
+        cls,
+        ctx: commands.Context,
+        source: PageSource,
+        *,
+        timeout: float = 100.0,
+        edit_interval: float = EDIT_INTERVAL,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], Awaitable[Any]] = asyncio.sleep,
+    ) -> Self:
+        self = cls(
+            ctx, source, timeout=timeout, edit_interval=edit_interval, clock=clock, sleep=sleep
+        )
+        self._add_buttons()
+        page = await self.source.get_page(0)
         kwargs = await self.source.format_page(page)
         self.msg = await self.ctx.send(view=self, **kwargs)
         return self
 
     async def show_page(self, page_number: int) -> None:
-        page = self.source.data[page_number]
+        page = await self.source.get_page(page_number)
         self.current_page = page_number
         kwargs = await self.source.format_page(page)
         await self.msg.edit(view=self, **kwargs)  # type:ignore
 
     async def show_checked_page(self, page_num: int) -> None:
-        max_len = len(self.source)
-        try:
-            if max_len > page_num >= 0:
-                await self.show_page(page_num)
-            elif max_len <= page_num:
-                await self.show_page(0)
-            else:
-                await self.show_page(max_len - 1)
-        except IndexError:
-            pass
+        """Queue a page up to be shown
+
+        Pages wrap around at either end. Presses that come in while waiting on
+        `edit_interval` are squashed, so only the newest page gets shown
+        """
+        max_len = self.source.page_count
+        if max_len is None and page_num < 0:
+            max_len = await self.source.resolve_count()
+        if max_len is not None:
+            if page_num >= max_len:
+                page_num = 0
+            elif page_num < 0:
+                page_num = max_len - 1
+        self._pending = page_num
+        if self._edit_task is None or self._edit_task.done():
+            self._edit_task = asyncio.create_task(self._edit_loop())
+
+    async def _edit_loop(self) -> None:
+        # Only this task edits the message, so pages can't show up out of order
+        while self._pending is not None:
+            wait = self._last_edit + self.edit_interval - self._clock()
+            if wait > 0:
+                await self._sleep(wait)
+            page_num, self._pending = self._pending, None
+            if page_num is None:
+                break
+            try:
+                try:
+                    await self.show_page(page_num)
+                except IndexError:
+                    # Ran off the end of a source that doesn't know its length
+                    await self.show_page(0)
+            except IndexError:
+                pass
+            except discord.HTTPException as e:
+                log.warning("Couldn't edit the menu", exc_info=e)
+            self._last_edit = self._clock()
 
     async def interaction_check(self, interaction: discord.Interaction) -> bool:
         if interaction.user.id != self.ctx.author.id:
@@ -0,0 +1,149 @@
+"""
+Demon name lookup for typos and autocomplete
+
+Names (and their aliases) go into a prefix trie for autocomplete, where every node
+already knows the first few names under it so completing is just walking the prefix.
+Anything the trie can't find gets ranked by how many trigrams it shares with the query.
+"""
+
+# Copyright (c) 2025 - Amy (jojo7791)
+# Licensed under MIT
+
+from __future__ import annotations
+
+from pathlib import Path
+from typing import Dict, Final, Iterable, List, Mapping, Optional, Set, Tuple, Union
+
+from .compendium import Compendium
+from .utils import load_json
+
+__all__: Final[Tuple[str, ...]] = ("NameIndex", "load_aliases")
+
+# Discord only shows 25 autocomplete choices
+COMPLETIONS: Final[int] = 25
+# How alike two names have to be (0-1) for a fuzzy match to count
+FUZZY_CUTOFF: Final[float] = 0.4
+
+
+def _trigrams(term: str) -> Set[str]:
+    # Padded so short names and the start of names still count
+    padded = f"  {term} "
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+def load_aliases(path: Union[str, Path]) -> Dict[str, List[str]]:
+    """{NAME: [ALIAS]} from a json file, empty if there isn't one"""
+    try:
+        with open(path) as fp:
+            return load_json(fp)
+    except FileNotFoundError:
+        return {}
+
+
+class _Node:
+    __slots__ = ("children", "names")
+
+    def __init__(self):
+        self.children: Dict[str, _Node] = {}
+        # The first `COMPLETIONS` names under this node, shortest first
+        self.names: List[str] = []
+
+
+class NameIndex:
+    """Every demon's name and aliases, for finding demons from what someone typed"""
+
+    def __init__(
+        self, names: Iterable[str], aliases: Optional[Mapping[str, Iterable[str]]] = None
+    ):
+        # {TERM: NAME} every name and alias, lowercased
+        self._terms: Dict[str, str] = {}
+        for name in names:
+            self._terms[name.lower()] = name
+        for name, name_aliases in (aliases or {}).items():
+            canonical = self._terms.get(name.lower())
+            if canonical is None:
+                # Aliases for demons that aren't in the compendium are skipped
+                continue
+            for alias in name_aliases:
+                self._terms.setdefault(alias.lower(), canonical)
+
+        self._root = _Node()
+        # Shortest first so "pixie" comes before "pixie queen"
+        for term in sorted(self._terms, key=lambda t: (len(t), t)):
+            self._insert(term)
+
+        self._term_list: Tuple[str, ...] = tuple(self._terms)
+        # {TRIGRAM: [TERM INDEX]}
+        self._trigrams: Dict[str, List[int]] = {}
+        self._trigram_counts: List[int] = []
+        for i, term in enumerate(self._term_list):
+            grams = _trigrams(term)
+            self._trigram_counts.append(len(grams))
+            for gram in grams:
+                self._trigrams.setdefault(gram, []).append(i)
+
+    @classmethod
+    def from_compendium(
+        cls, compendium: Compendium, aliases: Optional[Mapping[str, Iterable[str]]] = None
+    ) -> NameIndex:
+        return cls(compendium.names(), aliases)
+
+    def __len__(self) -> int:
+        return len(self._terms)
+
+    def _insert(self, term: str) -> None:
+        name = self._terms[term]
+        node = self._root
+        for char in term:
+            if name not in node.names and len(node.names) < COMPLETIONS:
+                node.names.append(name)
+            node = node.children.setdefault(char, _Node())
+        if name not in node.names and len(node.names) < COMPLETIONS:
+            node.names.append(name)
+
+    def get(self, query: str) -> Optional[str]:
+        """The demon a name or alias is for, None if it isn't an exact match"""
+        return self._terms.get(query.strip().lower())
+
+    def prefixed(self, prefix: str, limit: int = COMPLETIONS) -> List[str]:
+        """Demons with a name or alias starting with `prefix`"""
+        node = self._root
+        for char in prefix.strip().lower():
+            child = node.children.get(char)
+            if child is None:
+                return []
+            node = child
+        return node.names[:limit]
+
+    def fuzzy(
+        self, query: str, limit: int = COMPLETIONS, *, cutoff: float = FUZZY_CUTOFF
+    ) -> List[str]:
+        """Demons whose name or alias looks like `query`, the closest first"""
+        query = query.strip().lower()
+        if not query:
+            return []
+        grams = _trigrams(query)
+        shared: Dict[int, int] = {}
+        for gram in grams:
+            for i in self._trigrams.get(gram, ()):
+                shared[i] = shared.get(i, 0) + 1
+
+        # {NAME: SCORE} keeping an alias' best score for its demon
+        scores: Dict[str, float] = {}
+        for i, common in shared.items():
+            score = 2 * common / (len(grams) + self._trigram_counts[i])
+            if score < cutoff:
+                continue
+            name = self._terms[self._term_list[i]]
+            if score > scores.get(name, 0.0):
+                scores[name] = score
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], len(item[0]), item[0]))
+        return [name for name, _ in ranked[:limit]]
+
+    def complete(self, query: str, limit: int = COMPLETIONS) -> List[str]:
+        """Autocomplete choices, demons starting with `query` then ones that look like it"""
+        ret = self.prefixed(query, limit)
+        if len(ret) < limit and len(query.strip()) >= 2:
+            seen = set(ret)
+            ret.extend(name for name in self.fuzzy(query, limit) if name not in seen)
+        return ret[:limit]
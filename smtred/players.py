@@ -0,0 +1,208 @@
+# Copyright (c) 2025 - Amy (jojo7791)
+# Licensed under MIT
+
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import logging
+from typing import Any, AsyncIterator, Dict, Final, List, Set, Tuple
+
+from redbot.core import Config
+
+from ._types import UserMemberOrInt
+from .macca import _get_user_id
+from .utils import CacheStats, LRUCache
+
+__all__: Final[Tuple[str, ...]] = ("PlayerCache", "PlayerProfile")
+
+log = logging.getLogger("red.jojocogs.smtred.players")
+
+# How many players to keep in memory
+CACHE_SIZE: Final[int] = 5_000
+
+
+class PlayerProfile:
+    """Someone's whole user record from Config
+
+    Setting a field marks it as changed, anything changed in place (like appending to `demons`)
+    needs `mark_dirty` called for it. `PlayerCache.save` only writes the fields that changed
+    """
+
+    __slots__ = ("user_id", "_data", "_dirty")
+
+    def __init__(self, user_id: int, data: Dict[str, Any]):
+        self.user_id = user_id
+        self._data = data
+        self._dirty: Set[str] = set()
+
+    def __repr__(self) -> str:
+        return f"<PlayerProfile user_id={self.user_id} dirty={sorted(self._dirty)}>"
+
+    @property
+    def dirty(self) -> bool:
+        return bool(self._dirty)
+
+    def mark_dirty(self, *fields: str) -> None:
+        for field in fields:
+            if field not in self._data:
+                raise KeyError(field)
+        self._dirty.update(fields)
+
+    def _set(self, field: str, value: Any) -> None:
+        self._data[field] = value
+        self._dirty.add(field)
+
+    @property
+    def demons(self) -> List[Dict[str, Any]]:
+        return self._data["demons"]
+
+    @demons.setter
+    def demons(self, value: List[Dict[str, Any]]) -> None:
+        self._set("demons", value)
+
+    @property
+    def slots(self) -> Dict[str, str]:
+        """{SLOT: COMPENDIUM_ID} for the demons in `RosterStore`"""
+        return self._data["slots"]
+
+    @property
+    def next_slot(self) -> int:
+        return self._data["next_slot"]
+
+    @next_slot.setter
+    def next_slot(self, value: int) -> None:
+        self._set("next_slot", value)
+
+    @property
+    def items(self) -> list:
+        return self._data["items"]
+
+    @items.setter
+    def items(self, value: list) -> None:
+        self._set("items", value)
+
+    @property
+    def registered(self) -> List[str]:
+        return self._data["registered"]
+
+    @registered.setter
+    def registered(self, value: List[str]) -> None:
+        self._set("registered", value)
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        return self._data["stats"]
+
+    @stats.setter
+    def stats(self, value: Dict[str, int]) -> None:
+        self._set("stats", value)
+
+    @property
+    def finished(self) -> bool:
+        return self._data["finished"]
+
+    @finished.setter
+    def finished(self, value: bool) -> None:
+        self._set("finished", value)
+
+
+class PlayerCache:
+    """Everyone's user data from Config, read once and kept in memory
+
+    There's only ever one profile for someone at a time, so changes made through one
+    can't be lost to another. Profiles that failed to save are held on to outside of the
+    cache until `flush` gets them written
+    """
+
+    def __init__(self, config: Config, *, capacity: int = CACHE_SIZE):
+        self._config = config
+        # {USER_ID: PROFILE}
+        self._cache: LRUCache[int, PlayerProfile] = LRUCache(capacity)
+        # {USER_ID: PROFILE} these can't be evicted, they'd lose their changes
+        self._dirty: Dict[int, PlayerProfile] = {}
+        # {USER_ID: TASK} reads that are still going, so everyone asking gets the same profile
+        self._loading: Dict[int, asyncio.Task[PlayerProfile]] = {}
+
+    @property
+    def capacity(self) -> int:
+        return self._cache.capacity
+
+    @property
+    def stats(self) -> CacheStats:
+        return self._cache.stats
+
+    def warm(self, users: Dict[int, Dict[str, Any]]) -> int:
+        """Fill the cache from `Config.all_users()`, returns how many players got cached
+
+        Only as many as fit in the cache get loaded, everyone else is read when they're needed
+        """
+        loaded = 0
+        for user_id, data in users.items():
+            if loaded >= self.capacity:
+                break
+            if user_id not in self._cache and user_id not in self._dirty:
+                self._cache.set(user_id, PlayerProfile(user_id, data))
+            loaded += 1
+        return loaded
+
+    async def get(self, user: UserMemberOrInt) -> PlayerProfile:
+        """Someone's profile, this is at most one Config read"""
+        user_id = _get_user_id(user)
+        profile = self._dirty.get(user_id)
+        if profile is None:
+            profile = self._cache.get(user_id)
+        if profile is not None:
+            return profile
+        task = self._loading.get(user_id)
+        if task is None:
+            task = self._loading[user_id] = asyncio.ensure_future(self._load(user_id))
+        # Someone giving up on it shouldn't cancel it for everyone else
+        return await asyncio.shield(task)
+
+    async def _load(self, user_id: int) -> PlayerProfile:
+        try:
+            profile = PlayerProfile(user_id, await self._config.user_from_id(user_id).all())
+            self._cache.set(user_id, profile)
+            return profile
+        finally:
+            del self._loading[user_id]
+
+    async def save(self, profile: PlayerProfile) -> None:
+        """Write the fields that changed since the last save"""
+        if not profile._dirty:
+            return
+        dirty, profile._dirty = profile._dirty, set()
+        group = self._config.user_from_id(profile.user_id)
+        try:
+            if len(dirty) == 1:
+                (field,) = dirty
+                await group.set_raw(field, value=profile._data[field])
+            else:
+                async with group.all() as data:
+                    for field in dirty:
+                        data[field] = profile._data[field]
+        except BaseException:
+            profile._dirty |= dirty
+            self._dirty[profile.user_id] = profile
+            raise
+        if not profile._dirty and self._dirty.get(profile.user_id) is profile:
+            del self._dirty[profile.user_id]
+            self._cache.set(profile.user_id, profile)
+
+    async def flush(self) -> None:
+        """Try saving every profile that failed to save before"""
+        for profile in list(self._dirty.values()):
+            try:
+                await self.save(profile)
+            except Exception as e:
+                log.error("Couldn't save the profile of %d", profile.user_id, exc_info=e)
+
+    @contextlib.asynccontextmanager
+    async def edit(self, user: UserMemberOrInt) -> AsyncIterator[PlayerProfile]:
+        """Get someone's profile and save whatever changed once the block is done"""
+        profile = await self.get(user)
+        try:
+            yield profile
+        finally:
+            await self.save(profile)
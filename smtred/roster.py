@@ -0,0 +1,271 @@
+"""
+How the demons in someone's roster get saved
+
+Everything a demon has that's the same as its compendium entry gets left out,
+so a saved demon is just its compendium id and whatever's different about it:
+
+    {"v": 1, "id": "pixie", "stats": {"level": 5, "hp": 80}, "exp": 120}
+
+Saved demons are turned back into `Demon`s from the compendium template.
+Anything without a "v" is from before this and is a whole `Demon.to_json`
+
+Each demon is its own row in the ROSTER custom group, keyed by (USER_ID, SLOT),
+so changing one demon doesn't rewrite the rest. The player's `slots` keeps
+{SLOT: ID} so the roster can be listed without reading every row
+"""
+
+# Copyright (c) 2025 - Amy (jojo7791)
+# Licensed under MIT
+
+from __future__ import annotations
+
+import asyncio
+import contextlib
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    AsyncIterator,
+    Dict,
+    Final,
+    Iterable,
+    List,
+    Mapping,
+    Optional,
+    Tuple,
+)
+
+from redbot.core import Config
+
+from ._types import UserMemberOrInt
+from .compendium import Compendium
+from .demons import Demon, DemonNotFound
+from .macca import LOCK_STRIPES, _get_user_id
+
+if TYPE_CHECKING:
+    from .players import PlayerCache
+
+__all__: Final[Tuple[str, ...]] = (
+    "ROSTER_VERSION",
+    "RosterStore",
+    "decode_demon",
+    "decode_roster",
+    "demon_id",
+    "encode_demon",
+    "encode_roster",
+)
+
+# Bump this if the saved format changes, and teach `decode_demon` the old one
+ROSTER_VERSION: Final[int] = 1
+# How many demons `RosterStore.pages` reads at a time
+PAGE_SIZE: Final[int] = 25
+
+
+def _diff(current: Mapping[str, Any], base: Mapping[str, Any]) -> Dict[str, Any]:
+    return {key: value for key, value in current.items() if base.get(key) != value}
+
+
+def demon_id(data: Mapping[str, Any]) -> str:
+    """The compendium id of a saved demon, whichever format it's in"""
+    if "v" in data:
+        return data["id"]
+    return data["name"].lower()
+
+
+def encode_demon(demon: Demon, compendium: Compendium) -> Dict[str, Any]:
+    """Boil a demon down to its compendium id and what's different about it
+
+    Raises `DemonNotFound` if the demon isn't in the compendium
+    """
+    # The template's data is read as is, there's no need to thaw it just to compare
+    template = compendium[demon.name].data
+    ret: Dict[str, Any] = {"v": ROSTER_VERSION, "id": demon.name.lower()}
+
+    for field, current in (("stats", demon._stats), ("abilities", demon.abilities.to_json())):
+        changed = _diff(current, template.get(field, {}))
+        if changed:
+            ret[field] = changed
+    if demon.exp != template.get("exp", 0):
+        ret["exp"] = demon.exp
+
+    base_moves = template.get("moves", {})
+    learned: Dict[str, Dict[str, Any]] = {}
+    for move in demon.moves:
+        move_data = {"level": move.level, "cost": move.cost, "cost_type": move.cost_type.value}
+        if base_moves.get(move.name) != move_data:
+            learned[move.name] = move_data
+    if learned:
+        ret["learned"] = learned
+    known = {move.name for move in demon.moves}
+    forgot = [name for name in base_moves if name not in known]
+    if forgot:
+        ret["forgot"] = forgot
+    return ret
+
+
+def decode_demon(data: Mapping[str, Any], compendium: Compendium) -> Demon:
+    """Turn a saved demon back into a `Demon`
+
+    Raises `DemonNotFound` if its compendium entry is gone
+    """
+    if "v" not in data:
+        return Demon.from_json(dict(data))
+    if data["v"] != ROSTER_VERSION:
+        raise ValueError(f"Unknown roster version {data['v']!r}")
+
+    full = compendium[data["id"]].to_json()
+    for field in ("stats", "abilities"):
+        if field in data:
+            full.setdefault(field, {}).update(data[field])
+    if "exp" in data:
+        full["exp"] = data["exp"]
+    moves = full.setdefault("moves", {})
+    for name in data.get("forgot", ()):
+        moves.pop(name, None)
+    moves.update(data.get("learned", {}))
+    return Demon.from_json(full)
+
+
+def encode_roster(demons: Iterable[Demon], compendium: Compendium) -> List[Dict[str, Any]]:
+    return [encode_demon(demon, compendium) for demon in demons]
+
+
+def decode_roster(
+    roster: Iterable[Mapping[str, Any]], compendium: Compendium, *, skip_missing: bool = True
+) -> List[Demon]:
+    """Every demon in a saved roster
+
+    Demons whose compendium entry is gone are left out, unless `skip_missing` is False
+    in which case `DemonNotFound` gets raised
+    """
+    ret: List[Demon] = []
+    for data in roster:
+        try:
+            ret.append(decode_demon(data, compendium))
+        except DemonNotFound:
+            if not skip_missing:
+                raise
+    return ret
+
+
+class RosterStore:
+    """Everyone's demons, one Config row each
+
+    Needs `config.init_custom("ROSTER", 2)` and `config.register_custom("ROSTER")`
+    """
+
+    def __init__(self, config: Config, players: PlayerCache):
+        self._config = config
+        self._players = players
+        # Striped by user ID, anything that changes someone's slots holds theirs
+        self._locks: Tuple[asyncio.Lock, ...] = tuple(asyncio.Lock() for _ in range(LOCK_STRIPES))
+
+    @contextlib.asynccontextmanager
+    async def _locked(self, user_id: int) -> AsyncIterator[None]:
+        async with self._locks[user_id % LOCK_STRIPES]:
+            yield
+
+    def _row(self, user_id: int, slot: int):
+        return self._config.custom("ROSTER", str(user_id), str(slot))
+
+    async def ids(self, user: UserMemberOrInt) -> Dict[int, str]:
+        """{SLOT: COMPENDIUM_ID} for everything in someone's roster, no rows get read"""
+        profile = await self._players.get(user)
+        return {int(slot): id_ for slot, id_ in profile.slots.items()}
+
+    async def add(self, user: UserMemberOrInt, data: Dict[str, Any]) -> int:
+        """Save a demon (from `encode_demon`) in a new slot, returns the slot"""
+        user_id = _get_user_id(user)
+        async with self._locked(user_id):
+            profile = await self._players.get(user_id)
+            slot = profile.next_slot
+            profile.next_slot = slot + 1
+            profile.slots[str(slot)] = demon_id(data)
+            profile.mark_dirty("slots")
+            await self._row(user_id, slot).set(data)
+            await self._players.save(profile)
+        return slot
+
+    async def update(self, user: UserMemberOrInt, slot: int, data: Dict[str, Any]) -> None:
+        """Overwrite the demon in a slot, raises `KeyError` if the slot is empty"""
+        user_id = _get_user_id(user)
+        async with self._locked(user_id):
+            profile = await self._players.get(user_id)
+            if str(slot) not in profile.slots:
+                raise KeyError(slot)
+            await self._row(user_id, slot).set(data)
+
+    async def release(self, user: UserMemberOrInt, slot: int) -> None:
+        """Get rid of the demon in a slot, raises `KeyError` if the slot is empty"""
+        user_id = _get_user_id(user)
+        async with self._locked(user_id):
+            profile = await self._players.get(user_id)
+            del profile.slots[str(slot)]
+            profile.mark_dirty("slots")
+            await self._row(user_id, slot).clear()
+            await self._players.save(profile)
+
+    async def get(
+        self, user: UserMemberOrInt, slot: int, compendium: Compendium
+    ) -> Optional[Demon]:
+        """The demon in a slot, None if the slot is empty"""
+        profile = await self._players.get(user)
+        if str(slot) not in profile.slots:
+            return None
+        return decode_demon(await self._row(profile.user_id, slot).all(), compendium)
+
+    async def pages(
+        self, user: UserMemberOrInt, compendium: Compendium, *, page_size: int = PAGE_SIZE
+    ) -> AsyncIterator[List[Tuple[int, Demon]]]:
+        """Go through someone's roster `page_size` demons at a time, in slot order
+
+        Only the rows for the current page are read, demons whose compendium entry is gone
+        are skipped
+        """
+        profile = await self._players.get(user)
+        slots = sorted(map(int, profile.slots))
+        for start in range(0, len(slots), page_size):
+            page: List[Tuple[int, Demon]] = []
+            for slot in slots[start : start + page_size]:
+                data = await self._row(profile.user_id, slot).all()
+                if not data:
+                    # Released while we were paging
+                    continue
+                try:
+                    page.append((slot, decode_demon(data, compendium)))
+                except DemonNotFound:
+                    continue
+            if page:
+                yield page
+
+    async def migrate(self, user: UserMemberOrInt, compendium: Optional[Compendium]) -> int:
+        """Move someone's old `demons` list into rows, returns how many got moved
+
+        Old whole demons get boiled down with `encode_demon` if the compendium still has them,
+        otherwise they're kept as they are
+
+        The rows are written first and the slots, `next_slot` and the emptied list are saved
+        together at the end. If that save never happens the list is still there and running
+        this again writes over the same slots, so nothing gets moved twice
+        """
+        user_id = _get_user_id(user)
+        async with self._locked(user_id):
+            profile = await self._players.get(user_id)
+            demons = list(profile.demons)
+            if not demons:
+                return 0
+            first = profile.next_slot
+            profile.next_slot = first + len(demons)
+            slots: Dict[str, str] = {}
+            for slot, data in enumerate(demons, first):
+                if "v" not in data and compendium is not None:
+                    try:
+                        data = encode_demon(Demon.from_json(dict(data)), compendium)
+                    except DemonNotFound:
+                        pass
+                await self._row(user_id, slot).set(data)
+                slots[str(slot)] = demon_id(data)
+            profile.slots.update(slots)
+            profile.mark_dirty("slots")
+            profile.demons = []
+            await self._players.save(profile)
+        return len(demons)
@@ -0,0 +1,177 @@
+# Copyright (c) 2025 - Amy (jojo7791)
+# Licensed under MIT
+
+from __future__ import annotations
+
+import heapq
+import itertools
+from typing import (
+    TYPE_CHECKING,
+    Callable,
+    Dict,
+    Final,
+    Generic,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+    TypeVar,
+)
+
+if TYPE_CHECKING:
+    from .demons import Demon
+
+__all__: Final[Tuple[str, ...]] = ("ENEMY", "PLAYER", "TurnScheduler")
+
+PLAYER: Final[int] = 0
+ENEMY: Final[int] = 1
+
+_T = TypeVar("_T")
+
+
+def _demon_agility(demon: Demon) -> int:
+    return demon.abilities.agility
+
+
+class _Queue(Generic[_T]):
+    """Max heap on agility where removing things just marks them as dead
+
+    Dead entries get thrown away when they reach the top, so removing and re-keying is O(log n)
+    """
+
+    def __init__(self):
+        # [-AGILITY, SEQUENCE, ITEM, ALIVE]
+        self._heap: List[list] = []
+        # {id(ITEM): ENTRY}
+        self._entries: Dict[int, list] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, item: _T) -> bool:
+        return id(item) in self._entries
+
+    def push(self, item: _T, agility: int, sequence: int) -> None:
+        self.remove(item)
+        entry = [-agility, sequence, item, True]
+        self._entries[id(item)] = entry
+        heapq.heappush(self._heap, entry)
+
+    def remove(self, item: _T) -> None:
+        entry = self._entries.pop(id(item), None)
+        if entry is not None:
+            entry[3] = False
+
+    def _prune(self) -> None:
+        heap = self._heap
+        while heap and not heap[0][3]:
+            heapq.heappop(heap)
+
+    def peek(self) -> Optional[_T]:
+        self._prune()
+        return self._heap[0][2] if self._heap else None
+
+    def peek_agility(self) -> Optional[int]:
+        self._prune()
+        return -self._heap[0][0] if self._heap else None
+
+    def pop(self) -> Optional[_T]:
+        self._prune()
+        if not self._heap:
+            return None
+        entry = heapq.heappop(self._heap)
+        del self._entries[id(entry[2])]
+        return entry[2]
+
+    def entries(self) -> Iterator[list]:
+        return iter(self._entries.values())
+
+    def refill(self, entries: List[list]) -> None:
+        self._heap = [[*entry[:3], True] for entry in entries]
+        heapq.heapify(self._heap)
+        self._entries = {id(entry[2]): entry for entry in self._heap}
+
+
+class TurnScheduler(Generic[_T]):
+    """Turn order for both sides of a battle
+
+    Each side has everyone who's still standing (`members`) and whoever hasn't acted yet this
+    round. Faster demons go first, ties go to whoever joined first,
+    and if both sides are as fast as each other the player goes first.
+    """
+
+    def __init__(self, key: Callable[[_T], int] = _demon_agility):
+        self._key = key
+        self._sequence = itertools.count()
+        self._members: Tuple[_Queue[_T], _Queue[_T]] = (_Queue(), _Queue())
+        self._rounds: Tuple[_Queue[_T], _Queue[_T]] = (_Queue(), _Queue())
+        # {id(ITEM): (SIDE, SEQUENCE)}
+        self._sides: Dict[int, Tuple[int, int]] = {}
+
+    def __len__(self) -> int:
+        return len(self._sides)
+
+    def __contains__(self, item: _T) -> bool:
+        return id(item) in self._sides
+
+    def count(self, side: int) -> int:
+        return len(self._members[side])
+
+    def add(self, item: _T, side: int) -> None:
+        """Add a demon to a side, they'll be able to act this round if it's already going"""
+        if item in self:
+            raise ValueError("That's already in the battle")
+        sequence = next(self._sequence)
+        agility = self._key(item)
+        self._sides[id(item)] = (side, sequence)
+        self._members[side].push(item, agility, sequence)
+        self._rounds[side].push(item, agility, sequence)
+
+    def remove(self, item: _T) -> None:
+        """Take a demon out, like when they faint or get unsummoned"""
+        info = self._sides.pop(id(item), None)
+        if info is None:
+            return
+        side = info[0]
+        self._members[side].remove(item)
+        self._rounds[side].remove(item)
+
+    def update(self, item: _T) -> None:
+        """Call this when a demon's agility changes"""
+        info = self._sides.get(id(item))
+        if info is None:
+            return
+        side, sequence = info
+        agility = self._key(item)
+        self._members[side].push(item, agility, sequence)
+        if item in self._rounds[side]:
+            self._rounds[side].push(item, agility, sequence)
+
+    def start_round(self, side: int) -> None:
+        """Everyone on `side` gets to act again"""
+        self._rounds[side].refill(list(self._members[side].entries()))
+
+    def peek(self, side: int) -> Optional[_T]:
+        """Who's up next on `side`, a new round starts if everyone's already gone"""
+        current = self._rounds[side]
+        if current.peek() is None:
+            self.start_round(side)
+        return current.peek()
+
+    def next(self, side: int) -> Optional[_T]:
+        """Same as `peek` but they're marked as having acted"""
+        current = self._rounds[side]
+        if current.peek() is None:
+            self.start_round(side)
+        return current.pop()
+
+    def fastest(self, side: int) -> Optional[_T]:
+        return self._members[side].peek()
+
+    def first_side(self) -> int:
+        """Which side gets to go first"""
+        player = self._members[PLAYER].peek_agility()
+        enemy = self._members[ENEMY].peek_agility()
+        if enemy is not None and (player is None or enemy > player):
+            return ENEMY
+        return PLAYER
@@ -15,14 +15,49 @@ This gives more control to the user for attacking/buffing/debuffing
 
 from __future__ import annotations
 
-from typing import Optional
+import asyncio
+import contextlib
+import logging
+import random
+import sys
+import time
+from typing import Dict, Final, List, NamedTuple, Optional, Union
 
 import discord
 from redbot.core import commands
 
-from .demons import Demon, Party
+from ._types import UserMemberOrInt
+from .combat import ENEMY, PLAYER, Action, Battle, Combatant, Hit, Outcome, Result
+from .demons import Demon, DemonNotFound, Party
+from .macca import _get_user_id
+from .matrix import ResistanceMatrix
+from .snapshot import (
+    ActionRecord,
+    Snapshot,
+    SnapshotMismatch,
+    SnapshotStore,
+    check_action,
+    decode_action,
+    encode_action,
+)
 
-__all__ = ("AlreadyRunning", "NotRunning", "Session")
+__all__ = (
+    "AlreadyRunning",
+    "NotRunning",
+    "Session",
+    "SessionManager",
+    "SessionStats",
+    "TooManySessions",
+)
+
+log = logging.getLogger("red.jojocogs.smtred.session")
+
+# How many battles can be going at once
+MAX_SESSIONS: Final[int] = 500
+# How long a battle can sit without anyone pressing anything before it's dropped
+IDLE_TIMEOUT: Final[float] = 300.0
+# How many lines of the battle log get shown (and kept)
+LOG_SIZE: Final[int] = 5
 
 
 class AlreadyRunning(Exception):
@@ -37,29 +72,414 @@ class NotRunning(RuntimeError):
     pass
 
 
+class TooManySessions(RuntimeError):
+    """Gets raised when there are already `max_sessions` battles going"""
+
+    pass
+
+
+def _render_side(combatants: List[Combatant]) -> str:
+    return "\n".join(
+        f"{'~~' if not c.alive else ''}{c.demon.name}{'~~' if not c.alive else ''} "
+        f"HP {c.hp}/{c.max_hp} SP {c.sp}/{c.max_sp}"
+        for c in combatants
+    )
+
+
+def _render_result(result: Result) -> str:
+    actor = result.actor.demon.name
+    if result.outcome is Outcome.PASS:
+        return f"{actor} passed"
+    if result.hits:
+        return f"{actor} used {result.action.name} on everyone\n" + "\n".join(
+            _render_hit(hit) for hit in result.hits
+        )
+    target = result.target.demon.name if result.target else "nobody"
+    if result.outcome is Outcome.MISS:
+        return f"{actor} used {result.action.name} on {target} but missed"
+    if result.outcome is Outcome.NULL:
+        return f"{target} nulled {actor}'s {result.action.name}"
+    if result.outcome is Outcome.ABSORB:
+        return f"{target} absorbed {actor}'s {result.action.name} for {-result.damage} HP"
+    return (
+        f"{actor} used {result.action.name} on {target} for {result.damage} damage "
+        f"({result.outcome.value})"
+    )
+
+
+def _render_hit(hit: Hit) -> str:
+    target = hit.target.demon.name
+    if hit.outcome is Outcome.MISS:
+        return f"- missed {target}"
+    if hit.outcome is Outcome.NULL:
+        return f"- {target} nulled it"
+    if hit.outcome is Outcome.ABSORB:
+        return f"- {target} absorbed it for {-hit.damage} HP"
+    return f"- {target} took {hit.damage} damage ({hit.outcome.value})"
+
+
 class Session:
     def __init__(
         self,
         user: discord.User,
         player_party: Party,
         enemy_party: Party,
-        ctx: commands.Context,
+        ctx: Optional[commands.Context],
+        *,
+        seed: Optional[int] = None,
+        matrix: Optional[ResistanceMatrix] = None,
     ):
         self.user = user
         self.player_party = player_party
         self.enemy_party = enemy_party
         self.ctx = ctx
 
-        self._message: Optional[discord.Message] = None
-        self.current_demon: Demon
-        if (p_demon := self.player_party.current_demon).higher_agility(
-            e_demon := self.enemy_party.current_demon
-        ):
-            self.current_demon = p_demon
+        self._message: Optional[Union[discord.Message, discord.PartialMessage]] = None
+        self._log: List[str] = []
+        # Kept so the battle can be played back from a snapshot
+        self.seed = random.getrandbits(63) if seed is None else seed
+        self.battle = Battle(
+            list(self.player_party._demons),
+            list(self.enemy_party._demons),
+            seed=self.seed,
+            matrix=matrix,
+        )
+        # Set once the session is being snapshotted
+        self.snapshots: Optional[SnapshotStore] = None
+        # So two button presses don't act at the same time
+        self.lock = asyncio.Lock()
+        self.last_active = time.monotonic()
+
+    def approx_size(self) -> int:
+        """Roughly how many bytes this session holds on to, not counting the demons"""
+        size = sys.getsizeof(self) + sys.getsizeof(self.battle)
+        size += sys.getsizeof(self._log) + sum(map(sys.getsizeof, self._log))
+        for side in self.battle.sides:
+            size += sys.getsizeof(side) + sum(map(sys.getsizeof, side))
+        return size
+
+    @property
+    def current_demon(self) -> Demon:
+        return self.battle.actor.demon
+
+    def render(self) -> str:
+        battle = self.battle
+        turns = battle.press_turns
+        icons = "\N{LARGE BLUE CIRCLE}" * turns.full + "\N{LARGE BLUE DIAMOND}" * turns.half
+        ret = (
+            f"## Enemies\n{_render_side(battle.sides[ENEMY])}\n\n"
+            f"## Party\n{_render_side(battle.sides[PLAYER])}\n\n"
+            f"Press turns: {icons}\n"
+        )
+        if battle.finished:
+            ret += "\n**You won!**" if battle.winner == PLAYER else "\n**You were defeated...**"
         else:
-            self.current_demon = e_demon
+            ret += f"{self.current_demon.name}'s turn"
+        if self._log:
+            ret += "\n\n" + "\n".join(f"-# {line}" for line in self._log)
+        return ret
+
+    def _add_log(self, line: str) -> None:
+        self._log.append(line)
+        del self._log[:-LOG_SIZE]
+
+    def _enemy_turn(self) -> None:
+        while not self.battle.finished and self.battle.side == ENEMY:
+            self._add_log(_render_result(self.battle.auto_act()))
 
     async def start(self, ctx: commands.Context) -> None:
         if self._message:
             raise AlreadyRunning
-        ...
+        # The enemy might be faster
+        self._enemy_turn()
+        self._message = await ctx.send(self.render())
+        self.last_active = time.monotonic()
+
+    def _step(self, action: Action, target: Optional[Combatant]) -> Result:
+        result = self.battle.act(action, target)
+        self._add_log(_render_result(result))
+        self._enemy_turn()
+        return result
+
+    async def act(self, action: Action, target: Optional[Combatant] = None) -> Result:
+        """Do an action for the player then let the enemy take their turn"""
+        if not self._message:
+            raise NotRunning
+        self.last_active = time.monotonic()
+        actor = self.battle.actor
+        result = self._step(action, target)
+        if self.snapshots is not None:
+            # `lock` is held around this by the manager so the appends can't go out of order
+            await asyncio.get_running_loop().run_in_executor(
+                None,
+                self.snapshots.append,
+                self.user.id,
+                encode_action(self.battle, actor, action, target),
+            )
+        await self._message.edit(content=self.render())
+        return result
+
+    @classmethod
+    async def resume(
+        cls,
+        user: discord.User,
+        snapshot: Snapshot,
+        store: SnapshotStore,
+        message: Union[discord.Message, discord.PartialMessage],
+        *,
+        matrix: Optional[ResistanceMatrix] = None,
+    ) -> Session:
+        """Play a snapshot back into a session, the playing back happens in an executor
+
+        Raises `SnapshotMismatch` if it doesn't end up where it was saved
+        """
+        session = cls(
+            user,
+            Party(user, store.demons(snapshot.player)),
+            Party(user, store.demons(snapshot.enemy)),
+            None,
+            seed=snapshot.seed,
+            matrix=matrix,
+        )
+        await asyncio.get_running_loop().run_in_executor(None, session._replay, snapshot.actions)
+        session._message = message
+        session.snapshots = store
+        return session
+
+    def _replay(self, actions: List[ActionRecord]) -> None:
+        # Nothing else can see the session yet so this is fine to run in another thread
+        self._enemy_turn()
+        for record in actions:
+            self._step(*decode_action(self.battle, record))
+            check_action(self.battle, record)
+
+
+class SessionStats(NamedTuple):
+    live: int
+    peak: int
+    started: int
+    finished: int
+    evicted: int
+    resumed: int
+    memory: int
+
+    def __str__(self) -> str:
+        return (
+            f"{self.live} live (peak {self.peak}), {self.started} started, "
+            f"{self.finished} finished, {self.evicted} timed out, {self.resumed} resumed, "
+            f"~{self.memory / 1024:.1f}KiB"
+        )
+
+
+class SessionManager:
+    """Every battle that's going, one per user
+
+    Sessions that nobody has touched for `idle_timeout` seconds get dropped,
+    and no more than `max_sessions` can be going at once.
+    With `snapshots` set battles are saved as they go and picked back up
+    the next time the user acts after a reload.
+    Resumed battles share `matrix` if it's set
+    """
+
+    def __init__(
+        self,
+        bot: Optional[discord.Client] = None,
+        *,
+        max_sessions: int = MAX_SESSIONS,
+        idle_timeout: float = IDLE_TIMEOUT,
+        snapshots: Optional[SnapshotStore] = None,
+        matrix: Optional[ResistanceMatrix] = None,
+    ):
+        self.bot = bot
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.snapshots = snapshots
+        self.matrix = matrix
+        # {USER_ID: SESSION}
+        self._sessions: Dict[int, Session] = {}
+        self._reaper: Optional[asyncio.Task] = None
+        self._peak = 0
+        self._started = 0
+        self._finished = 0
+        self._evicted = 0
+        self._resumed = 0
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def __contains__(self, user: UserMemberOrInt) -> bool:  # type:ignore
+        return _get_user_id(user) in self._sessions
+
+    @property
+    def stats(self) -> SessionStats:
+        return SessionStats(
+            len(self._sessions),
+            self._peak,
+            self._started,
+            self._finished,
+            self._evicted,
+            self._resumed,
+            sum(session.approx_size() for session in self._sessions.values()),
+        )
+
+    def start_reaper(self) -> None:
+        """Start dropping idle sessions in the background"""
+        if self._reaper is None:
+            self._reaper = asyncio.create_task(self._reap_loop())
+
+    async def close(self) -> None:
+        """Stop dropping idle sessions and forget them, their snapshots are kept"""
+        if self._reaper is not None:
+            self._reaper.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._reaper
+            self._reaper = None
+        self._sessions.clear()
+
+    async def _reap_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.idle_timeout / 2)
+            try:
+                await self.evict_idle()
+            except Exception as e:
+                log.error("Couldn't drop idle sessions", exc_info=e)
+
+    async def evict_idle(self) -> int:
+        """Drop every session that's been idle for too long, returns how many were dropped"""
+        cutoff = time.monotonic() - self.idle_timeout
+        idle = [
+            (user_id, session)
+            for user_id, session in self._sessions.items()
+            if session.last_active <= cutoff and not session.lock.locked()
+        ]
+        for user_id, session in idle:
+            if self._sessions.get(user_id) is session:
+                del self._sessions[user_id]
+                self._evicted += 1
+                self._drop_snapshot(user_id)
+        for _, session in idle:
+            if session._message is not None:
+                with contextlib.suppress(discord.HTTPException):
+                    await session._message.edit(
+                        content=f"{session.render()}\n\n**The battle timed out**"
+                    )
+        return len(idle)
+
+    def get(self, user: UserMemberOrInt) -> Optional[Session]:
+        return self._sessions.get(_get_user_id(user))
+
+    def _drop_snapshot(self, user_id: int) -> None:
+        if self.snapshots is not None:
+            try:
+                self.snapshots.delete(user_id)
+            except OSError as e:
+                log.warning("Couldn't delete the snapshot for %d", user_id, exc_info=e)
+
+    async def _resume(self, user: UserMemberOrInt) -> Optional[Session]:
+        user_id = _get_user_id(user)
+        if self.snapshots is None or self.bot is None:
+            return None
+        loop = asyncio.get_running_loop()
+        snapshot = await loop.run_in_executor(None, self.snapshots.load, user_id)
+        if snapshot is None:
+            return None
+        channel = self.bot.get_channel(snapshot.channel_id)
+        if channel is None or not hasattr(channel, "get_partial_message"):
+            self._drop_snapshot(user_id)
+            return None
+        if isinstance(user, int):
+            user = self.bot.get_user(user_id) or discord.Object(user_id)  # type:ignore
+        message = channel.get_partial_message(snapshot.message_id)  # type:ignore
+        try:
+            session = await Session.resume(
+                user, snapshot, self.snapshots, message, matrix=self.matrix  # type:ignore
+            )
+        except (SnapshotMismatch, DemonNotFound, ValueError) as e:
+            log.warning("Couldn't resume the battle for %d", user_id, exc_info=e)
+            self._drop_snapshot(user_id)
+            return None
+        if session.battle.finished:
+            self._drop_snapshot(user_id)
+            return None
+        if len(self._sessions) >= self.max_sessions:
+            await self.evict_idle()
+            if len(self._sessions) >= self.max_sessions:
+                raise TooManySessions
+        # Something else might have resumed it while we were evicting
+        session = self._sessions.setdefault(user_id, session)
+        self._resumed += 1
+        self._peak = max(self._peak, len(self._sessions))
+        return session
+
+    async def start(self, session: Session, ctx: commands.Context) -> None:
+        """Start a session and keep track of it
+
+        Raises `AlreadyRunning` if the user already has a battle going
+        and `TooManySessions` if there's no room for another one
+        """
+        user_id = session.user.id
+        if user_id in self._sessions:
+            raise AlreadyRunning
+        if len(self._sessions) >= self.max_sessions:
+            await self.evict_idle()
+            # Another start for this user could have got in while evicting
+            if user_id in self._sessions:
+                raise AlreadyRunning
+            if len(self._sessions) >= self.max_sessions:
+                raise TooManySessions
+        # Taken with no await since the checks so the same user can't sneak in a second one
+        self._sessions[user_id] = session
+        try:
+            await session.start(ctx)
+        except BaseException:
+            if self._sessions.get(user_id) is session:
+                del self._sessions[user_id]
+            raise
+        self._started += 1
+        self._peak = max(self._peak, len(self._sessions))
+        if self.snapshots is not None and session._message is not None:
+            try:
+                await asyncio.get_running_loop().run_in_executor(
+                    None,
+                    self.snapshots.create,
+                    user_id,
+                    session._message.channel.id,
+                    session._message.id,
+                    session.seed,
+                    [c.demon for c in session.battle.sides[PLAYER]],
+                    [c.demon for c in session.battle.sides[ENEMY]],
+                )
+            except OSError as e:
+                log.warning("Couldn't snapshot the battle for %d", user_id, exc_info=e)
+            else:
+                session.snapshots = self.snapshots
+
+    async def act(
+        self, user: UserMemberOrInt, action: Action, target: Optional[Combatant] = None
+    ) -> Result:
+        """Act in someone's battle, one action at a time
+
+        Battles from before a reload get resumed from their snapshot here.
+        Raises `NotRunning` if they don't have a battle going
+        """
+        user_id = _get_user_id(user)
+        session = self._sessions.get(user_id) or await self._resume(user)
+        if session is None:
+            raise NotRunning
+        async with session.lock:
+            if self._sessions.get(user_id) is not session:
+                # Timed out or ended while waiting for the lock
+                raise NotRunning
+            result = await session.act(action, target)
+            if session.battle.finished:
+                self.end(user_id)
+        return result
+
+    def end(self, user: UserMemberOrInt) -> Optional[Session]:
+        """Stop keeping track of someone's battle, returning it if there was one"""
+        user_id = _get_user_id(user)
+        session = self._sessions.pop(user_id, None)
+        if session is not None:
+            self._finished += 1
+        self._drop_snapshot(user_id)
+        return session
@@ -0,0 +1,269 @@
+"""
+Monte Carlo battle simulator
+
+Runs a whole lot of seeded `Battle`s between two parties from the compendium across a process
+pool so encounters can be balanced without blocking the bot.
+Every battle gets its own seed (`seed + battle number`) so results don't depend on how many
+workers there are.
+
+Workers are spawned, not forked, so they don't get a copy of the running bot. They only read
+the compendium cache, it's rebuilt (if it needs to be) once before they start.
+
+The enemy can also be a level, then every battle gets a random encounter for that level
+(see `encounters.py`), drawn in one batch per chunk.
+
+It can be used from a script too:
+    python -m smtred.simulate path/to/demons.json "pixie, jack frost" "jack frost" 100000
+    python -m smtred.simulate path/to/demons.json "pixie, jack frost" 5 100000
+"""
+
+# Copyright (c) 2025 - Amy (jojo7791)
+# Licensed under MIT
+
+from __future__ import annotations
+
+import asyncio
+import multiprocessing
+import random
+import site
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass
+from pathlib import Path
+from typing import AsyncIterator, Final, Iterator, List, Optional, Sequence, Tuple, Union
+
+from .cache import load_compendium
+from .combat import PLAYER, Battle
+from .compendium import Compendium
+from .demons import DemonNotFound
+from .encounters import EncounterGenerator
+from .matrix import ResistanceMatrix
+
+__all__: Final[Tuple[str, ...]] = (
+    "SimulationStats",
+    "parse_enemy",
+    "parse_party",
+    "simulate",
+    "simulate_async",
+)
+
+CHUNK_SIZE: Final[int] = 1000
+MAX_ROUNDS: Final[int] = 200
+# Red doesn't put cog folders on sys.path, spawned workers need it to import this package
+_IMPORT_PATH: Final[str] = str(Path(__file__).resolve().parents[1])
+
+# Each worker process loads the compendium once
+_compendium: Optional[Compendium] = None
+_encounters: Optional[EncounterGenerator] = None
+_matrix: Optional[ResistanceMatrix] = None
+
+
+@dataclass
+class SimulationStats:
+    battles: int = 0
+    wins: int = 0
+    losses: int = 0
+    rounds: int = 0
+    macca: int = 0
+    exp: int = 0
+
+    def __add__(self, other: SimulationStats) -> SimulationStats:
+        return SimulationStats(
+            self.battles + other.battles,
+            self.wins + other.wins,
+            self.losses + other.losses,
+            self.rounds + other.rounds,
+            self.macca + other.macca,
+            self.exp + other.exp,
+        )
+
+    @property
+    def draws(self) -> int:
+        """Battles that hit the round limit"""
+        return self.battles - self.wins - self.losses
+
+    @property
+    def win_rate(self) -> float:
+        return self.wins / self.battles if self.battles else 0.0
+
+    @property
+    def average_rounds(self) -> float:
+        return self.rounds / self.battles if self.battles else 0.0
+
+    @property
+    def average_macca(self) -> float:
+        return self.macca / self.battles if self.battles else 0.0
+
+    @property
+    def average_exp(self) -> float:
+        return self.exp / self.battles if self.battles else 0.0
+
+    def __str__(self) -> str:
+        return (
+            f"Battles: {self.battles}\n"
+            f"Win rate: {self.win_rate:.2%} ({self.wins}W/{self.losses}L/{self.draws}D)\n"
+            f"Average rounds: {self.average_rounds:.2f}\n"
+            f"Average payout: ћ{self.average_macca:.1f} / {self.average_exp:.1f} exp"
+        )
+
+
+def _load_worker(
+    path: Union[str, Path],
+) -> Tuple[Compendium, EncounterGenerator, ResistanceMatrix]:
+    global _compendium, _encounters, _matrix
+    if _compendium is None or _encounters is None or _matrix is None:
+        _compendium = load_compendium(path, write_cache=False)
+        _encounters = EncounterGenerator(_compendium)
+        _matrix = ResistanceMatrix(_compendium)
+    return _compendium, _encounters, _matrix
+
+
+def _make_pool(workers: Optional[int]) -> ProcessPoolExecutor:
+    # Forking would copy the bot's threads, sockets and held locks into every worker
+    return ProcessPoolExecutor(
+        workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=site.addsitedir,
+        initargs=(_IMPORT_PATH,),
+    )
+
+
+def _run_chunk(
+    path: Union[str, Path],
+    player: Sequence[str],
+    enemy: Union[Sequence[str], int],
+    start: int,
+    count: int,
+    max_rounds: int,
+) -> SimulationStats:
+    compendium, encounters, matrix = _load_worker(path)
+    player_templates = [compendium[name] for name in player]
+    if isinstance(enemy, int):
+        # Seeded from the chunk so results don't depend on the workers either
+        parties = encounters.draw_many([enemy] * count, rng=random.Random(start))
+    else:
+        parties = [enemy] * count
+
+    stats = SimulationStats()
+    for seed, party in zip(range(start, start + count), parties):
+        enemy_templates = [compendium[name] for name in party]
+        macca = sum(t.data.get("macca", 0) for t in enemy_templates)
+        exp = sum(t.data.get("exp", 0) for t in enemy_templates)
+        battle = Battle(
+            [t.to_demon() for t in player_templates],
+            [t.to_demon() for t in enemy_templates],
+            seed=seed,
+            matrix=matrix,
+        )
+        winner = battle.run(max_rounds)
+        stats.battles += 1
+        stats.rounds += battle.round
+        if winner is None:
+            continue
+        if winner == PLAYER:
+            stats.wins += 1
+            stats.macca += macca
+            stats.exp += exp
+        else:
+            stats.losses += 1
+    return stats
+
+
+def _chunks(battles: int, seed: int, chunk_size: int) -> Iterator[Tuple[int, int]]:
+    for start in range(0, battles, chunk_size):
+        yield seed + start, min(chunk_size, battles - start)
+
+
+def _check_names(path: Union[str, Path], *parties: Union[Sequence[str], int]) -> None:
+    # Better to find out here than from every worker
+    # this is also what refreshes the cache, the workers don't write it
+    compendium = load_compendium(path)
+    for party in parties:
+        if isinstance(party, int):
+            if not len(compendium):
+                raise ValueError("There's nothing to draw encounters from")
+            continue
+        if not party:
+            raise ValueError("Both parties need at least one demon")
+        for name in party:
+            if name not in compendium:
+                raise DemonNotFound
+
+
+def simulate(
+    path: Union[str, Path],
+    player: Sequence[str],
+    enemy: Union[Sequence[str], int],
+    battles: int,
+    *,
+    seed: int = 0,
+    workers: Optional[int] = None,
+    chunk_size: int = CHUNK_SIZE,
+    max_rounds: int = MAX_ROUNDS,
+) -> Iterator[SimulationStats]:
+    """Run `battles` battles, yielding the running totals every time a chunk finishes"""
+    _check_names(path, player, enemy)
+    total = SimulationStats()
+    with _make_pool(workers) as pool:
+        futures = [
+            pool.submit(_run_chunk, path, player, enemy, start, count, max_rounds)
+            for start, count in _chunks(battles, seed, chunk_size)
+        ]
+        for future in as_completed(futures):
+            total += future.result()
+            yield total
+
+
+async def simulate_async(
+    path: Union[str, Path],
+    player: Sequence[str],
+    enemy: Union[Sequence[str], int],
+    battles: int,
+    *,
+    seed: int = 0,
+    workers: Optional[int] = None,
+    chunk_size: int = CHUNK_SIZE,
+    max_rounds: int = MAX_ROUNDS,
+) -> AsyncIterator[SimulationStats]:
+    """Same as `simulate` but for use inside the bot, the event loop never waits on a battle"""
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(None, _check_names, path, player, enemy)
+    total = SimulationStats()
+    pool = _make_pool(workers)
+    futures: List[asyncio.Future[SimulationStats]] = []
+    try:
+        futures.extend(
+            loop.run_in_executor(pool, _run_chunk, path, player, enemy, start, count, max_rounds)
+            for start, count in _chunks(battles, seed, chunk_size)
+        )
+        for future in asyncio.as_completed(futures):
+            total += await future
+            yield total
+    finally:
+        for future in futures:
+            future.cancel()
+        pool.shutdown(wait=False)
+
+
+def parse_party(party: str) -> List[str]:
+    return [name.strip() for name in party.split(",") if name.strip()]
+
+
+def parse_enemy(enemy: str) -> Union[List[str], int]:
+    """A party, or an encounter level for something like `level 5` or `5`"""
+    level = enemy.strip().lower()
+    for prefix in ("level", "lv"):
+        if level.startswith(prefix):
+            level = level[len(prefix) :].strip()
+            break
+    if level.isdigit():
+        return int(level)
+    return parse_party(enemy)
+
+
+if __name__ == "__main__":
+    path, player, enemy, battles = sys.argv[1:5]
+    stats = SimulationStats()
+    for stats in simulate(path, parse_party(player), parse_enemy(enemy), int(battles)):
+        print(f"{stats.battles}/{battles}", end="\r")
+    print(stats)
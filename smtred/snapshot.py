@@ -0,0 +1,194 @@
+"""
+Battle snapshots so fights survive the cog reloading
+
+`Battle` is deterministic (everything random goes through its seeded `rng`),
+so a battle is saved as how it started plus what the player did, and gets
+played back to where it was when it's needed again. The layout is (all little endian):
+
+    header:  magic, version, user id, channel id, message id, seed, length of the parties
+    parties: compact json of both parties (see `roster.py`)
+    actions: one fixed size record per player action, appended as they happen
+
+Each action also has the round and both sides' total HP after it, if playing it back
+doesn't end up there the snapshot is thrown away instead of resuming a different fight.
+A half written action at the end (from a crash) is ignored.
+"""
+
+# Copyright (c) 2025 - Amy (jojo7791)
+# Licensed under MIT
+
+from __future__ import annotations
+
+import logging
+import os
+import struct
+from pathlib import Path
+from typing import Any, Dict, Final, List, NamedTuple, Optional, Tuple
+
+from .combat import ENEMY, PASS, PLAYER, Action, Battle, Combatant
+from .compendium import Compendium
+from .demons import Demon, DemonNotFound
+from .roster import decode_demon, encode_demon
+from .utils import dumps_json, loads_json
+
+__all__: Final[Tuple[str, ...]] = ("Snapshot", "SnapshotStore", "SnapshotMismatch")
+
+log = logging.getLogger("red.jojocogs.smtred.snapshot")
+
+MAGIC: Final[bytes] = b"SMTS"
+# Bump this whenever the layout or how `Battle` uses its rng changes
+VERSION: Final[int] = 1
+SNAPSHOT_SUFFIX: Final[str] = ".smts"
+
+# magic, version, user id, channel id, message id, seed, parties length
+_HEADER: Final[struct.Struct] = struct.Struct("<4sHQQQQI")
+# action, target, round, player hp, enemy hp
+_ACTION: Final[struct.Struct] = struct.Struct("<BBHII")
+# Used for the action when passing and the target when there isn't one
+_NONE: Final[int] = 0xFF
+
+
+class SnapshotMismatch(ValueError):
+    """Gets raised when playing a snapshot back doesn't match what was saved"""
+
+    pass
+
+
+class ActionRecord(NamedTuple):
+    action: int
+    target: int
+    round: int
+    player_hp: int
+    enemy_hp: int
+
+
+class Snapshot(NamedTuple):
+    user_id: int
+    channel_id: int
+    message_id: int
+    seed: int
+    player: List[Dict[str, Any]]
+    enemy: List[Dict[str, Any]]
+    actions: List[ActionRecord]
+
+
+def _side_hp(battle: Battle, side: int) -> int:
+    return sum(combatant.hp for combatant in battle.sides[side])
+
+
+def _save_demon(demon: Demon, compendium: Compendium) -> Dict[str, Any]:
+    try:
+        return encode_demon(demon, compendium)
+    except DemonNotFound:
+        return demon.to_json()
+
+
+def encode_action(battle: Battle, actor: Combatant, action: Action, target: Optional[Combatant]):
+    """Pack a player action, `battle` should be how it is after the action (and enemy turn)"""
+    return _ACTION.pack(
+        _NONE if action is PASS else actor.actions.index(action),
+        _NONE if target is None else battle.sides[target.side].index(target),
+        battle.round,
+        _side_hp(battle, PLAYER),
+        _side_hp(battle, ENEMY),
+    )
+
+
+def decode_action(battle: Battle, record: ActionRecord) -> Tuple[Action, Optional[Combatant]]:
+    """Turn a saved action back into something `Battle.act` takes"""
+    try:
+        action = PASS if record.action == _NONE else battle.actor.actions[record.action]
+        target = (
+            None
+            if record.target == _NONE
+            else battle.sides[ENEMY if battle.side == PLAYER else PLAYER][record.target]
+        )
+    except IndexError:
+        raise SnapshotMismatch("Saved action doesn't exist in the battle") from None
+    return action, target
+
+
+def check_action(battle: Battle, record: ActionRecord) -> None:
+    """Raise `SnapshotMismatch` if the battle isn't where the record says it should be"""
+    if (battle.round, _side_hp(battle, PLAYER), _side_hp(battle, ENEMY)) != record[2:]:
+        raise SnapshotMismatch("Playing the battle back went differently")
+
+
+class SnapshotStore:
+    """Where the snapshots live, one file per user"""
+
+    def __init__(self, path: Path, compendium: Compendium):
+        self.path = path
+        self.compendium = compendium
+        path.mkdir(parents=True, exist_ok=True)
+
+    def _path_for(self, user_id: int) -> Path:
+        return self.path / f"{user_id}{SNAPSHOT_SUFFIX}"
+
+    def exists(self, user_id: int) -> bool:
+        return self._path_for(user_id).exists()
+
+    def create(
+        self,
+        user_id: int,
+        channel_id: int,
+        message_id: int,
+        seed: int,
+        player: List[Demon],
+        enemy: List[Demon],
+    ) -> None:
+        """Write how a battle started, replacing any old snapshot for the user"""
+        parties = dumps_json(
+            {
+                "player": [_save_demon(demon, self.compendium) for demon in player],
+                "enemy": [_save_demon(demon, self.compendium) for demon in enemy],
+            }
+        )
+        header = _HEADER.pack(MAGIC, VERSION, user_id, channel_id, message_id, seed, len(parties))
+        # Written to a temp file first so a half written header is never picked up
+        path = self._path_for(user_id)
+        tmp = path.with_suffix(f"{SNAPSHOT_SUFFIX}.tmp")
+        with open(tmp, "wb") as fp:
+            fp.write(header + parties)
+        os.replace(tmp, path)
+
+    def append(self, user_id: int, record: bytes) -> None:
+        """Add one action to the end of a snapshot, this is a single small write"""
+        with open(self._path_for(user_id), "ab") as fp:
+            fp.write(record)
+
+    def delete(self, user_id: int) -> None:
+        try:
+            self._path_for(user_id).unlink()
+        except FileNotFoundError:
+            pass
+
+    def load(self, user_id: int) -> Optional[Snapshot]:
+        """Read someone's snapshot, None if they don't have one or it's broken"""
+        try:
+            raw = self._path_for(user_id).read_bytes()
+        except OSError:
+            return None
+        try:
+            magic, version, saved_user, channel_id, message_id, seed, length = _HEADER.unpack_from(
+                raw
+            )
+            if magic != MAGIC or version != VERSION or saved_user != user_id:
+                raise ValueError("Snapshot is from something else")
+            start = _HEADER.size
+            parties = loads_json(raw[start : start + length])
+            start += length
+            # A half written action from a crash gets left off
+            end = start + (len(raw) - start) // _ACTION.size * _ACTION.size
+            actions = [ActionRecord(*a) for a in _ACTION.iter_unpack(raw[start:end])]
+            player, enemy = parties["player"], parties["enemy"]
+            if not isinstance(player, list) or not isinstance(enemy, list):
+                raise TypeError("Snapshot parties aren't lists")
+        except (struct.error, ValueError, KeyError, TypeError) as e:
+            log.warning("Throwing away the broken snapshot for %d", user_id, exc_info=e)
+            self.delete(user_id)
+            return None
+        return Snapshot(user_id, channel_id, message_id, seed, player, enemy, actions)
+
+    def demons(self, saved: List[Dict[str, Any]]) -> List[Demon]:
+        return [decode_demon(data, self.compendium) for data in saved]
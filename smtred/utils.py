@@ -3,16 +3,18 @@
 
 from __future__ import annotations
 
-from typing import TYPE_CHECKING
+import time
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Generic, NamedTuple, Optional, Tuple, TypeVar
 
-__all__ = ("load_json",)
+__all__ = ("CacheStats", "LRUCache", "dumps_json", "load_json", "loads_json")
 
 
 try:
     import orjson
 
     if TYPE_CHECKING:
-        from typing import Any
+        from typing import Any, Union
 
         from ._types import Readable
 
@@ -21,7 +23,108 @@ try:
     def load_json(fp: Readable, *args, **kwargs) -> Any:
         return orjson.loads(fp.read(), *args, **kwargs)
 
+    def loads_json(data: Union[bytes, str]) -> Any:
+        return orjson.loads(data)
+
+    def dumps_json(obj: Any) -> bytes:
+        return orjson.dumps(obj)
+
 except ModuleNotFoundError:
     import json
 
     load_json = json.load
+    loads_json = json.loads
+
+    def dumps_json(obj: Any) -> bytes:
+        return json.dumps(obj, separators=(",", ":")).encode()
+
+
+K = TypeVar("K")
+V = TypeVar("V")
+
+
+class CacheStats(NamedTuple):
+    size: int
+    capacity: int
+    hits: int
+    misses: int
+    evictions: int
+    expirations: int
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def __str__(self) -> str:
+        return (
+            f"{self.size}/{self.capacity} entries, {self.hit_rate:.1%} hit rate "
+            f"({self.hits} hits, {self.misses} misses), "
+            f"{self.evictions} evicted, {self.expirations} expired"
+        )
+
+
+class LRUCache(Generic[K, V]):
+    """A dict that only holds on to the `capacity` most recently used things
+
+    If `ttl` is set things also get dropped once they're that many seconds old
+    """
+
+    def __init__(self, capacity: int, *, ttl: Optional[float] = None):
+        if capacity < 1:
+            raise ValueError("Capacity has to be at least 1")
+        self.capacity = capacity
+        self.ttl = ttl
+        # {KEY: (VALUE, EXPIRES_AT)}
+        self._data: OrderedDict[K, Tuple[V, float]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: object) -> bool:
+        item = self._data.get(key)  # type:ignore
+        return item is not None and item[1] > time.monotonic()
+
+    def get(self, key: K, default: Optional[V] = None) -> Optional[V]:
+        item = self._data.get(key)
+        if item is None:
+            self.misses += 1
+            return default
+        if item[1] <= time.monotonic():
+            del self._data[key]
+            self.expirations += 1
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return item[0]
+
+    def set(self, key: K, value: V) -> None:
+        expires = time.monotonic() + self.ttl if self.ttl is not None else float("inf")
+        self._data[key] = (value, expires)
+        self._data.move_to_end(key)
+        while len(self._data) > self.capacity:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def pop(self, key: K, default: Optional[V] = None) -> Optional[V]:
+        item = self._data.pop(key, None)
+        return default if item is None else item[0]
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    @property
+    def stats(self) -> CacheStats:
+        return CacheStats(
+            len(self._data),
+            self.capacity,
+            self.hits,
+            self.misses,
+            self.evictions,
+            self.expirations,
+        )
@@ -0,0 +1,158 @@
+# Copyright (c) 2025 - Amy (jojo7791)
+# Licensed under MIT
+
+from __future__ import annotations
+
+import asyncio
+from typing import AsyncIterator, List, Optional, Tuple
+
+from smtred.modals import BaseButton, Menu, Page, StreamSource
+
+
+class FakeResponse:
+    def __init__(self):
+        self.done = False
+
+    def is_done(self) -> bool:
+        return self.done
+
+    async def defer(self) -> None:
+        self.done = True
+
+
+class FakeInteraction:
+    def __init__(self):
+        self.response = FakeResponse()
+
+
+class FakeClock:
+    """Time only moves when `advance` is called, sleepers wake up once it passes their deadline"""
+
+    def __init__(self):
+        self.now = 100.0
+        # (DEADLINE, FUTURE)
+        self._sleepers: List[Tuple[float, asyncio.Future]] = []
+
+    def __call__(self) -> float:
+        return self.now
+
+    async def sleep(self, delay: float) -> None:
+        future = asyncio.get_running_loop().create_future()
+        self._sleepers.append((self.now + delay, future))
+        await future
+
+    async def advance(self, seconds: float) -> None:
+        self.now += seconds
+        for deadline, future in list(self._sleepers):
+            if deadline <= self.now:
+                self._sleepers.remove((deadline, future))
+                future.set_result(None)
+        await _settle()
+
+
+async def _settle() -> None:
+    # Let everything that's ready run until it's waiting on something again
+    for _ in range(50):
+        await asyncio.sleep(0)
+
+
+class FakeMessage:
+    def __init__(self):
+        self.edits: List[Optional[str]] = []
+
+    async def edit(self, **kwargs) -> None:
+        # Discord takes a moment too
+        await asyncio.sleep(0)
+        self.edits.append(kwargs.get("content"))
+
+    async def delete(self) -> None:
+        pass
+
+
+class FakeContext:
+    async def embed_requested(self) -> bool:
+        return False
+
+    async def embed_colour(self) -> None:
+        return None
+
+    async def send(self, **kwargs) -> FakeMessage:
+        return FakeMessage()
+
+
+def _button(menu: Menu, *, forward: bool, skip: bool) -> BaseButton:
+    return next(
+        b
+        for b in menu.children
+        if isinstance(b, BaseButton) and b.forward is forward and b.skip is skip
+    )
+
+
+def test_presses_are_coalesced():
+    async def run() -> None:
+        ctx = FakeContext()
+        clock = FakeClock()
+        menu = await Menu.start(
+            ctx,
+            Page(ctx, [f"page {i}" for i in range(10)]),
+            edit_interval=0.2,
+            clock=clock,
+            sleep=clock.sleep,
+        )
+        forward = _button(menu, forward=True, skip=False)
+
+        presses = [FakeInteraction() for _ in range(7)]
+        for inter in presses:
+            await forward.callback(inter)
+            await clock.advance(0.02)
+        # Every press is answered straight away even though the edits are held back
+        assert all(inter.response.done for inter in presses)
+        assert menu.target_page == 7
+        # The first press goes out right away, the rest are waiting on the interval
+        assert len(menu.msg.edits) == 1
+        assert menu.msg.edits[0].startswith("page 1")
+
+        await clock.advance(0.2)
+        menu.stop()
+        # The other six get squashed into one edit
+        assert len(menu.msg.edits) == 2
+        assert menu.current_page == 7
+        assert menu.msg.edits[-1].startswith("page 7")
+
+    asyncio.run(run())
+
+
+def test_stream_source_pulls_one_at_a_time():
+    async def run() -> None:
+        ctx = FakeContext()
+
+        async def pages() -> AsyncIterator[str]:
+            for i in range(30):
+                await asyncio.sleep(0)
+                yield f"page {i}"
+
+        clock = FakeClock()
+        menu = await Menu.start(
+            ctx,
+            StreamSource(ctx, pages, cache_size=2),
+            edit_interval=0,
+            clock=clock,
+            sleep=clock.sleep,
+        )
+        forward = _button(menu, forward=True, skip=False)
+        back_skip = _button(menu, forward=False, skip=True)
+
+        await forward.callback(FakeInteraction())
+        await forward.callback(FakeInteraction())
+        # Just enough for the edit to start pulling the next page
+        await asyncio.sleep(0)
+        # The page is still loading, going back to the end needs the count from the same generator
+        await back_skip.callback(FakeInteraction())
+
+        await _settle()
+        menu.stop()
+        assert menu.source.page_count == 30
+        assert menu.current_page == 29
+        assert menu.msg.edits[-1].startswith("page 29")
+
+    asyncio.run(run())